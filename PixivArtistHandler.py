@@ -10,7 +10,8 @@ import PixivConstant
 import PixivDownloadHandler
 import PixivHelper
 import PixivImageHandler
-from PixivException import PixivException
+import PixivRunJournal
+from PixivException import PixivCircuitOpenException, PixivException
 
 
 def process_member(caller,
@@ -27,6 +28,7 @@ def process_member(caller,
     # caller function/method
     # TODO: ideally to be removed or passed as argument
     db = caller.__dbManager__
+    journal = PixivRunJournal.get_journal()
     # np = caller.np
     # np_is_valid = caller.np_is_valid
 
@@ -52,6 +54,18 @@ def process_member(caller,
     offset_start = (page - 1) * offset
     offset_stop = end_page * offset
 
+    # all posts of the member from profile/all, sorted by the newest first
+    is_full_listing = not bookmark and not tags and not config.r18mode and page == 1
+    sync_cutoff = 0
+    if config.incrementalMemberSync and is_full_listing:
+        sync_cutoff = db.selectLastSyncImageByMemberId(member_id)
+        if sync_cutoff > 0:
+            PixivHelper.print_and_log('info', f'Incremental sync, only processing the images newer than image_id: {sync_cutoff}')
+    newest_image_id = 0
+    sync_completed = False
+    # some posts are not downloaded, the member is not marked as done in the run journal
+    has_failed = False
+
     try:
         no_of_images = 1
         is_avatar_downloaded = False
@@ -67,6 +81,9 @@ def process_member(caller,
                 try:
                     (artist, list_page) = PixivBrowserFactory.getBrowser().getMemberPage(member_id, page, bookmark, tags, r18mode=config.r18mode, throw_empty_error=True)
                     break
+                except PixivCircuitOpenException:
+                    # let the caller park the member
+                    raise
                 except PixivException as ex:
                     caller.ERROR_CODE = ex.errorCode
                     PixivHelper.print_and_log('info', f'Member ID ({member_id}): {ex}')
@@ -85,7 +102,9 @@ def process_member(caller,
                         if ex.errorCode == PixivException.OTHER_MEMBER_ERROR:
                             PixivHelper.print_and_log(None, ex.message)
                             caller.__errorList.append(dict(type="Member", id=str(member_id), message=ex.message, exception=ex))
-                    return
+                    if ex.errorCode in (PixivException.NO_IMAGES, PixivException.USER_ID_NOT_EXISTS, PixivException.USER_ID_SUSPENDED):
+                        return PixivConstant.PIXIVUTIL_OK
+                    return PixivConstant.PIXIVUTIL_NOT_OK
                 except AttributeError:
                     # Possible layout changes, try to dump the file below
                     raise
@@ -116,7 +135,28 @@ def process_member(caller,
             db.updateMemberName(member_id, artist.artistName, artist.artistToken)
 
             result = PixivConstant.PIXIVUTIL_NOT_OK
-            for image_id in artist.imageList:
+            page_failed = False
+            image_list = artist.imageList
+            if is_full_listing and newest_image_id == 0 and len(image_list) > 0:
+                newest_image_id = int(image_list[0])
+            reached_cutoff = False
+            if sync_cutoff > 0:
+                new_image_list = [x for x in image_list if int(x) > sync_cutoff]
+                if len(new_image_list) < len(image_list):
+                    PixivHelper.print_and_log('info', f"Reached the images from the last sync, {len(new_image_list)} new image(s) in this page.")
+                    reached_cutoff = True
+                image_list = new_image_list
+            if journal is not None and journal.is_done(PixivRunJournal.ITEM_PAGE, f"{member_id}/{page}"):
+                PixivHelper.print_and_log('info', f"Page {page} already completed in run id: {journal.run_id}")
+                no_of_images = no_of_images + len(image_list)
+                image_list = []
+            downloaded = PixivImageHandler.get_downloaded_image_ids(caller, config, image_list)
+            for (index, image_id) in enumerate(image_list):
+                if journal is not None and journal.is_done(PixivRunJournal.ITEM_POST, image_id):
+                    PixivHelper.print_and_log(None, f"Already completed in run id {journal.run_id}: {image_id}")
+                    no_of_images = no_of_images + 1
+                    continue
+                PixivImageHandler.prefetch_image_pages(caller, config, image_list[index + 1:], downloaded)
                 ui_prefix = f'{Fore.LIGHTGREEN_EX}[{no_of_images} of {artist.totalImages}]{Style.RESET_ALL} '
                 # PixivHelper.print_and_log(None, ui_prefix)
                 retry_count = 0
@@ -131,7 +171,10 @@ def process_member(caller,
                         else:
                             total_image_page_count = ((page - 1) * 20) + len(artist.imageList)
                         title_prefix_img = f"{title_prefix}MemberId: {member_id} Page: {page} Post {no_of_images}+{updated_limit_count} of {total_image_page_count}"
-                        if not caller.DEBUG_SKIP_PROCESS_IMAGE:
+                        if int(image_id) in downloaded:
+                            PixivHelper.print_and_log(None, f'{ui_prefix}Already downloaded in DB: {image_id}')
+                            result = PixivConstant.PIXIVUTIL_SKIP_DUPLICATE_NO_WAIT
+                        elif not caller.DEBUG_SKIP_PROCESS_IMAGE:
                             result = PixivImageHandler.process_image(caller,
                                                                      config,
                                                                      artist,
@@ -147,10 +190,12 @@ def process_member(caller,
                     except KeyboardInterrupt:
                         result = PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT
                         break
+                    except PixivCircuitOpenException:
+                        raise
                     except BaseException:
                         if retry_count > config.retry:
                             PixivHelper.print_and_log('error', f"Giving up image_id: {image_id}")
-                            return
+                            return PixivConstant.PIXIVUTIL_NOT_OK
                         retry_count = retry_count + 1
                         PixivHelper.print_and_log(None, f"Stuff happened, trying again after 2 second ({retry_count})")
                         exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -159,7 +204,12 @@ def process_member(caller,
                         PixivHelper.print_delay(2)
 
                 no_of_images = no_of_images + 1
-                
+                if result in (PixivConstant.PIXIVUTIL_NOT_OK, PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT):
+                    page_failed = True
+                    has_failed = True
+                elif journal is not None:
+                    journal.mark_done(PixivRunJournal.ITEM_POST, image_id)
+
                 if result in (PixivConstant.PIXIVUTIL_SKIP_DUPLICATE,
                               PixivConstant.PIXIVUTIL_SKIP_LOCAL_LARGER,
                               PixivConstant.PIXIVUTIL_SKIP_DUPLICATE_NO_WAIT):
@@ -168,12 +218,11 @@ def process_member(caller,
                         PixivHelper.safePrint(f"Skipping member: {member_id}")
                         db.updateLastDownloadDate(member_id)
                         PixivBrowserFactory.getBrowser(config=config).clear_history()
-                        return
+                        return PixivConstant.PIXIVUTIL_NOT_OK if has_failed else PixivConstant.PIXIVUTIL_OK
                     gc.collect()
                     continue
                 if result == PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT:
-                    choice = input("Keyboard Interrupt detected, continue to next image (Y/N)").rstrip("\r")
-                    if choice.upper() == 'N':
+                    if not PixivHelper.ask_continue("Keyboard Interrupt detected, continue to next image (Y/N)"):
                         PixivHelper.print_and_log("info", f"Member: {member_id}, processing aborted")
                         flag = False
                         break
@@ -188,9 +237,15 @@ def process_member(caller,
 
                 PixivHelper.wait(result, config)
 
-            if artist.isLastPage:
+            # the failed posts of the page are retried on --resume
+            if flag and not page_failed and journal is not None:
+                journal.mark_done(PixivRunJournal.ITEM_PAGE, f"{member_id}/{page}")
+
+            if artist.isLastPage or reached_cutoff:
                 db.updateLastDownloadDate(member_id)
-                PixivHelper.print_and_log(None, "Last Page")
+                if artist.isLastPage:
+                    PixivHelper.print_and_log(None, "Last Page")
+                sync_completed = flag
                 flag = False
 
             page = page + 1
@@ -213,10 +268,17 @@ def process_member(caller,
         if int(image_id) > 0:
             db.updateLastDownloadedImage(member_id, image_id)
             log_message = f'last image_id: {image_id}'
+        elif sync_cutoff > 0:
+            log_message = f'no new images since image_id: {sync_cutoff}.'
         else:
             log_message = 'no images were found.'
 
+        # only when all posts are processed, so incrementalMemberSync will not skip the older posts of an interrupted run
+        if is_full_listing and sync_completed and not has_failed and newest_image_id > 0:
+            db.updateLastSyncImage(member_id, newest_image_id)
+
         PixivHelper.print_and_log("info", f"Member_id: {member_id} completed: {log_message}")
+        return PixivConstant.PIXIVUTIL_NOT_OK if has_failed else PixivConstant.PIXIVUTIL_OK
     except KeyboardInterrupt:
         raise
     except Exception:
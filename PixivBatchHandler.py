@@ -7,11 +7,14 @@ from copy import deepcopy
 import PixivArtistHandler
 import PixivBrowserFactory
 import PixivConfig
+import PixivConstant
 import PixivHelper
 import PixivImageHandler
+import PixivRunJournal
 import PixivSketchHandler
 import PixivTagsHandler
 import PixivUtil2
+from PixivException import PixivCircuitOpenException
 
 _default_batch_filename = "./batch_job.json"
 
@@ -66,25 +69,42 @@ def handle_members(caller, job, job_name, job_option):
     if "include_sketch" in job and len(job["include_sketch"]) > 0:
         include_sketch = bool(job["include_sketch"])
 
+    journal = PixivRunJournal.get_journal()
+    incomplete = False
     for member_id in member_ids:
-        PixivArtistHandler.process_member(caller,
-                                          job_option.config,
-                                          member_id=member_id,
-                                          user_dir=job_option.config.rootDirectory,
-                                          page=start_page,
-                                          end_page=end_page,
-                                          bookmark=from_bookmark,
-                                          tags=tags,
-                                          title_prefix=f"{job_name} ")
-        if include_sketch:
-            # fetching artist token...
-            (artist_model, _) = PixivBrowserFactory.getBrowser().getMemberPage(member_id)
-            PixivSketchHandler.process_sketch_artists(caller,
-                                                      job_option.config,
-                                                      artist_model.artistToken,
-                                                      start_page=start_page,
-                                                      end_page=end_page,
-                                                      title_prefix=f"{job_name} ")
+        if journal is not None and journal.is_done(PixivRunJournal.ITEM_MEMBER, member_id):
+            print(f"Member id = {member_id} already completed in run id: {journal.run_id}")
+            continue
+        try:
+            result = PixivArtistHandler.process_member(caller,
+                                                       job_option.config,
+                                                       member_id=member_id,
+                                                       user_dir=job_option.config.rootDirectory,
+                                                       page=start_page,
+                                                       end_page=end_page,
+                                                       bookmark=from_bookmark,
+                                                       tags=tags,
+                                                       title_prefix=f"{job_name} ")
+            if include_sketch:
+                # fetching artist token...
+                (artist_model, _) = PixivBrowserFactory.getBrowser().getMemberPage(member_id)
+                PixivSketchHandler.process_sketch_artists(caller,
+                                                          job_option.config,
+                                                          artist_model.artistToken,
+                                                          start_page=start_page,
+                                                          end_page=end_page,
+                                                          title_prefix=f"{job_name} ")
+        except PixivCircuitOpenException as ex:
+            PixivHelper.print_and_log("warn", f"Skipping member id = {member_id} for now ==> {ex.message}")
+            caller.__errorList.append(dict(type="Member", id=str(member_id), message=ex.message, exception=ex))
+            incomplete = True
+            continue
+        # some posts failed, retry the member on --resume
+        if result != PixivConstant.PIXIVUTIL_OK:
+            incomplete = True
+        elif journal is not None:
+            journal.mark_done(PixivRunJournal.ITEM_MEMBER, member_id)
+    return incomplete
 
 
 def handle_images(caller: PixivUtil2, job, job_name, job_option):
@@ -99,13 +119,35 @@ def handle_images(caller: PixivUtil2, job, job_name, job_option):
         print(f"No image_id or image_ids found in {job_name}!")
         return
 
+    journal = PixivRunJournal.get_journal()
+    incomplete = False
+    downloaded = PixivImageHandler.get_downloaded_image_ids(caller, job_option.config, image_ids)
     for image_id in image_ids:
-        PixivImageHandler.process_image(caller,
-                                        job_option.config,
-                                        image_id=image_id,
-                                        user_dir=job_option.config.rootDirectory,
-                                        title_prefix=f"{job_name} ")
+        if journal is not None and journal.is_done(PixivRunJournal.ITEM_POST, image_id):
+            print(f"Image id = {image_id} already completed in run id: {journal.run_id}")
+            continue
+        if int(image_id) in downloaded:
+            PixivHelper.print_and_log(None, f"Already downloaded in DB: {image_id}")
+            if journal is not None:
+                journal.mark_done(PixivRunJournal.ITEM_POST, image_id)
+            continue
+        try:
+            result = PixivImageHandler.process_image(caller,
+                                                     job_option.config,
+                                                     image_id=image_id,
+                                                     user_dir=job_option.config.rootDirectory,
+                                                     title_prefix=f"{job_name} ")
+        except PixivCircuitOpenException as ex:
+            PixivHelper.print_and_log("warn", f"Skipping image id = {image_id} for now ==> {ex.message}")
+            caller.__errorList.append(dict(type="Image", id=str(image_id), message=ex.message, exception=ex))
+            incomplete = True
+            continue
+        if result in (PixivConstant.PIXIVUTIL_NOT_OK, PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT):
+            incomplete = True
+        elif journal is not None:
+            journal.mark_done(PixivRunJournal.ITEM_POST, image_id)
     print("done.")
+    return incomplete
 
 
 def handle_tags(caller: PixivUtil2, job, job_name, job_option):
@@ -180,7 +222,7 @@ def handle_tags(caller: PixivUtil2, job, job_name, job_option):
                                   type_mode=type_mode)
 
 
-def process_batch_job(caller: PixivUtil2, batch_file=None):
+def process_batch_job(caller: PixivUtil2, batch_file=None, run_id=None):
     PixivHelper.get_logger().info('Batch Mode from json (b).')
     caller.set_console_title("Batch Menu")
 
@@ -197,27 +239,45 @@ def process_batch_job(caller: PixivUtil2, batch_file=None):
         active_job = len([y for y in jobs["jobs"] if jobs["jobs"][y]["enabled"]])
         PixivHelper.print_and_log("info", f"Found {active_job} active job(s) of {total_job} jobs from {batch_file}.")
 
-        for job_name in jobs["jobs"]:
-            PixivHelper.print_and_log("info", f"Processing {job_name}")
-            curr_job = jobs["jobs"][job_name]
-
-            if "enabled" not in curr_job or not bool(curr_job["enabled"]):
-                PixivHelper.print_and_log("warn", f"Skipping {job_name} because not enabled.")
-                continue
-
-            if "job_type" not in curr_job:
-                PixivHelper.print_and_log("error", f"Cannot find job_type in {job_name}")
-                continue
-
-            job_option = JobOption(curr_job, caller.__config__)
-            if curr_job["job_type"] == '1':
-                handle_members(caller, curr_job, job_name, job_option)
-            elif curr_job["job_type"] == '2':
-                handle_images(caller, curr_job, job_name, job_option)
-            elif curr_job["job_type"] == '3':
-                handle_tags(caller, curr_job, job_name, job_option)
-            else:
-                PixivHelper.print_and_log("error", f"Unsupported job_type {curr_job['job_type']} in {job_name}")
+        journal = PixivRunJournal.start(caller.__dbManager__, "batch", run_id)
+        try:
+            for job_name in jobs["jobs"]:
+                PixivHelper.print_and_log("info", f"Processing {job_name}")
+                curr_job = jobs["jobs"][job_name]
+
+                if "enabled" not in curr_job or not bool(curr_job["enabled"]):
+                    PixivHelper.print_and_log("warn", f"Skipping {job_name} because not enabled.")
+                    continue
+
+                if "job_type" not in curr_job:
+                    PixivHelper.print_and_log("error", f"Cannot find job_type in {job_name}")
+                    continue
+
+                journal.set_scope()
+                if journal.is_done(PixivRunJournal.ITEM_JOB, job_name):
+                    PixivHelper.print_and_log("info", f"Skipping {job_name} because already completed in run id: {journal.run_id}")
+                    continue
+
+                job_option = JobOption(curr_job, caller.__config__)
+                # the members and posts are recorded per job, as each job can have different options
+                journal.set_scope(job_name)
+                incomplete = False
+                if curr_job["job_type"] == '1':
+                    incomplete = handle_members(caller, curr_job, job_name, job_option)
+                elif curr_job["job_type"] == '2':
+                    incomplete = handle_images(caller, curr_job, job_name, job_option)
+                elif curr_job["job_type"] == '3':
+                    handle_tags(caller, curr_job, job_name, job_option)
+                else:
+                    PixivHelper.print_and_log("error", f"Unsupported job_type {curr_job['job_type']} in {job_name}")
+                    continue
+                journal.set_scope()
+                if incomplete:
+                    PixivHelper.print_and_log("warn", f"{job_name} is not completed, use --resume={journal.run_id} to download the skipped/failed items.")
+                    continue
+                journal.mark_done(PixivRunJournal.ITEM_JOB, job_name)
+        finally:
+            PixivRunJournal.stop()
     else:
         PixivHelper.print_and_log("error", f"Cannot found {batch_file}, see https://github.com/Nandaka/PixivUtil2/wiki/Using-Batch-Job-(Experimental) for example. ")
 
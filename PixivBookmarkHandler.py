@@ -88,14 +88,19 @@ def process_image_bookmark(caller,
         totalList.extend(public_list)
 
         PixivHelper.print_and_log('info', f"Found {len(totalList)} of {total_bookmark_count} possible image(s) .")
-        for item in totalList:
+        downloaded = PixivImageHandler.get_downloaded_image_ids(caller, config, totalList)
+        for (index, item) in enumerate(totalList):
+            PixivImageHandler.prefetch_image_pages(caller, config, totalList[index + 1:], downloaded)
             print(f"Image # {image_count}")
+            image_count = image_count + 1
+            if int(item) in downloaded:
+                PixivHelper.print_and_log(None, f'Already downloaded in DB: {item}')
+                continue
             result = PixivImageHandler.process_image(caller,
                                                      config,
                                                      artist=None,
                                                      image_id=item,
                                                      search_tags=tag)
-            image_count = image_count + 1
             PixivHelper.wait(result, config)
 
         print("Done.\n")
@@ -125,14 +130,19 @@ def process_new_illust_from_bookmark(caller,
                 mode = "r18"
             pb = br.getFollowedNewIllusts(mode, current_page=i)
 
-            for image_id in pb.imageList:
+            downloaded = PixivImageHandler.get_downloaded_image_ids(caller, config, pb.imageList)
+            for (index, image_id) in enumerate(pb.imageList):
+                PixivImageHandler.prefetch_image_pages(caller, config, pb.imageList[index + 1:], downloaded)
                 print(f"Image #{image_count}")
+                image_count = image_count + 1
+                if int(image_id) in downloaded:
+                    PixivHelper.print_and_log(None, f'Already downloaded in DB: {image_id}')
+                    continue
                 result = PixivImageHandler.process_image(caller,
                                                          config,
                                                          artist=None,
                                                          image_id=int(image_id),
                                                          bookmark_count=bookmark_count)
-                image_count = image_count + 1
 
                 if result == PixivConstant.PIXIVUTIL_SKIP_OLDER:
                     flag = False
@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=W0603, C0325
 
+import gzip
 import http.client
 import http.cookiejar
+import io
 import json
 import re
 import socket
 import sys
-import time
+import threading
 import traceback
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.error import HTTPError
 from urllib.parse import urlparse
 from urllib.request import Request
@@ -23,25 +28,98 @@ from colorama import Fore, Style
 import PixivHelper
 from PixivArtist import PixivArtist
 from PixivBookmark import PixivNewIllustBookmark
-from PixivException import PixivException
+from PixivException import PixivCircuitOpenException, PixivException
 from PixivImage import PixivImage, PixivMangaSeries
 from PixivModelFanbox import FanboxArtist, FanboxPost
 from PixivModelSketch import SketchArtist, SketchPost
 from PixivNovel import MAX_LIMIT, NovelSeries, PixivNovel
 from PixivOAuth import PixivOAuth
+import PixivRateLimiter
+import PixivResponseCache
+import PixivRetryPolicy
 from PixivRanking import PixivNewIllust, PixivRanking
 from PixivTags import PixivTags
 
 defaultCookieJar = None
 defaultConfig = None
 _browser = None
+_oauth_manager_lock = threading.Lock()
+# shared by all browsers, see prefetchImagePages()
+_prefetch_executor = None
+_prefetch_lock = threading.Lock()
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# host classes of the html and json endpoints, the images and files are not compressed.
+TEXT_HOST_CLASSES = ("pixiv", "api", "fanbox", "sketch")
+ACCEPT_ENCODING = "gzip, br" if brotli is not None else "gzip"
+
+# host class => [compressed responses, bytes transferred, bytes decompressed, uncompressed responses]
+_transfer_stats = dict()
+_transfer_stats_lock = threading.Lock()
+
+
+def _count_transfer(host_class, compressed_size=None, size=None):
+    with _transfer_stats_lock:
+        stat = _transfer_stats.setdefault(host_class, [0, 0, 0, 0])
+        if compressed_size is None:
+            stat[3] += 1
+        else:
+            stat[0] += 1
+            stat[1] += compressed_size
+            stat[2] += size
+
+
+def print_transfer_stats():
+    with _transfer_stats_lock:
+        stats = {host_class: list(stat) for (host_class, stat) in _transfer_stats.items()}
+    if len(stats) == 0:
+        return
+    PixivHelper.print_and_log('info', 'Compressed transfer statistics:')
+    for (host_class, (count, compressed_size, size, uncompressed_count)) in sorted(stats.items()):
+        saved = 1 - compressed_size / size if size > 0 else 0
+        PixivHelper.print_and_log('info', f' - {host_class}: {count} compressed responses, {PixivHelper.size_in_str(compressed_size)} transferred for ' +
+                                  f'{PixivHelper.size_in_str(size)} ({saved:.1%} saved), {uncompressed_count} uncompressed responses')
+
+
+class ContentEncodingProcessor(mechanize.BaseHandler):
+    ''' request compressed response for the html and json endpoints, and decompress it before the other handlers.'''
+    handler_order = 200
+
+    def http_request(self, request):
+        if PixivRateLimiter.get_host_class(request) in TEXT_HOST_CLASSES \
+           and not request.has_header('Range') \
+           and not request.has_header('Accept-encoding'):
+            request.add_header('Accept-Encoding', ACCEPT_ENCODING)
+        return request
+
+    def http_response(self, request, response):
+        host_class = PixivRateLimiter.get_host_class(request)
+        if host_class not in TEXT_HOST_CLASSES:
+            return response
+        headers = response.info()
+        encoding = (headers.get('Content-Encoding') or '').strip().lower()
+        if encoding == 'gzip' or (encoding == 'br' and brotli is not None):
+            compressed = response.read()
+            data = gzip.decompress(compressed) if encoding == 'gzip' else brotli.decompress(compressed)
+            response._set_fp(io.BytesIO(data))
+            del headers['Content-Encoding']
+            del headers['Content-Length']
+            _count_transfer(host_class, len(compressed), len(data))
+        else:
+            _count_transfer(host_class)
+        return response
+
+    https_request = http_request
+    https_response = http_response
 
 
 # pylint: disable=E1101
 class PixivBrowser(mechanize.Browser):
     _config = None
-    _cache = dict()
-    _max_cache = 10000  # keep n-item in memory
     _myId = 0
     _isPremium = False
     _xRestrict = 0
@@ -54,52 +132,57 @@ class PixivBrowser(mechanize.Browser):
     _is_logged_in_to_FANBOX = False
 
     __oauth_manager = None
+    # (username, password) and the refresh tokens known by the current oauth manager, see _oauth_manager
+    __oauth_credentials = None
+    __oauth_tokens = None
+
+    # image_id => Future of (ajax response, ugoira_meta response)
+    _prefetched = None
 
     @property
     def _oauth_manager(self):
-        if self.__oauth_manager is None:
-            proxy = None
+        # shared by all browsers, so the access token is reused by the worker browsers.
+        # rebuilt if the credentials or the refresh token are changed, e.g. by reloading the config.
+        with _oauth_manager_lock:
             assert (self._config is not None)
-            if self._config.useProxy:
-                proxy = self._config.proxy
-            if self._config is not None:
-                if self._username is None:
-                    self._username = self._config.username
-                if self._password is None:
-                    self._password = self._config.password
-            self.__oauth_manager = PixivOAuth(self._username,
-                                              self._password,
-                                              proxies=proxy,
-                                              refresh_token=self._config.refresh_token,
-                                              validate_ssl=self._config.enableSSLVerification)
-        return self.__oauth_manager
-
-    def _put_to_cache(self, key, item, expiration=3600):
-        expiry = time.time() + expiration
-        self._cache[key] = (item, expiry)
-
-        # check oldest item
-        oldest_expiry = expiry
-        oldest_item = key
-        if len(self._cache) > self._max_cache:
-            for key2 in self._cache:
-                curr_expiry = self._cache[key2][1]
-                if curr_expiry < oldest_expiry:
-                    oldest_item = key2
-                    oldest_expiry = curr_expiry
-            del self._cache[oldest_item]
+            if self._username is None:
+                self._username = self._config.username
+            if self._password is None:
+                self._password = self._config.password
+            if PixivBrowser.__oauth_manager is None or \
+               PixivBrowser.__oauth_credentials != (self._username, self._password) or \
+               self._config.refresh_token not in PixivBrowser.__oauth_tokens:
+                proxy = None
+                if self._config.useProxy:
+                    proxy = self._config.proxy
+                PixivBrowser.__oauth_credentials = (self._username, self._password)
+                PixivBrowser.__oauth_tokens = {self._config.refresh_token}
+                PixivBrowser.__oauth_manager = PixivOAuth(self._username,
+                                                          self._password,
+                                                          proxies=proxy,
+                                                          refresh_token=self._config.refresh_token,
+                                                          validate_ssl=self._config.enableSSLVerification,
+                                                          config=self._config)
+        return PixivBrowser.__oauth_manager
+
+    def _update_refresh_token(self):
+        ''' save the refresh token to config.ini if it is rotated by the OAuth login '''
+        # the worker browsers can call this at the same time, only write config.ini once
+        with _oauth_manager_lock:
+            if PixivBrowser.__oauth_manager is None:
+                return
+            refresh_token = PixivBrowser.__oauth_manager._refresh_token
+            if refresh_token is not None and self._config.refresh_token != refresh_token:
+                PixivHelper.print_and_log('info', 'OAuth Refresh Token is updated, updating config.ini')
+                PixivBrowser.__oauth_tokens.add(refresh_token)
+                self._config.refresh_token = refresh_token
+                self._config.writeConfig(path=self._config.configFileLocation)
+
+    def _put_to_cache(self, key, item, expiration=3600, size=None):
+        PixivResponseCache.get_cache(self._config).put(key, item, expiration, size)
 
     def _get_from_cache(self, key, sliding_window=3600):
-        if key in self._cache.keys():
-            (item, expiry) = self._cache.pop(key)
-            if expiry - time.time() > 0:
-                self._cache[key] = (item, expiry + sliding_window)
-                return item
-
-            # expired data
-            del item
-
-        return None
+        return PixivResponseCache.get_cache(self._config).get(key, sliding_window)
 
     def __init__(self, config, cookie_jar):
         # fix #218 not applicable after upgrading to mechanize 4.x
@@ -153,6 +236,8 @@ class PixivBrowser(mechanize.Browser):
         # self.set_handle_gzip(True)
         self.set_handle_redirect(True)
         self.set_handle_referer(True)
+        if config.enableCompression and not any(isinstance(handler, ContentEncodingProcessor) for handler in self.handlers):
+            self.add_handler(ContentEncodingProcessor())
         self.set_handle_robots(False)
 
         self.set_debug_http(config.debugHttp)
@@ -190,55 +275,119 @@ class PixivBrowser(mechanize.Browser):
     def addCookie(self, cookie):
         global defaultCookieJar
         if defaultCookieJar is None:
-            defaultCookieJar = http.cookiejar.LWPCookieJar()
+            defaultCookieJar = ThreadSafeCookieJar()
         defaultCookieJar.set_cookie(cookie)
 
     def clearCookie(self):
         global defaultCookieJar
         if defaultCookieJar is None:
-            defaultCookieJar = http.cookiejar.LWPCookieJar()
+            defaultCookieJar = ThreadSafeCookieJar()
         defaultCookieJar.clear()
 
+    def _copyLoginState(self, browser):
+        self._myId = browser._myId
+        self._isPremium = browser._isPremium
+        self._xRestrict = browser._xRestrict
+        self._locale = browser._locale
+        self._username = browser._username
+        self._password = browser._password
+        self._is_logged_in_to_FANBOX = browser._is_logged_in_to_FANBOX
+
     def open_with_retry(self, url, data=None, timeout=60, retry=0):
-        ''' Return response object with retry.'''
-        retry_count = 0
+        ''' Return response object with retry.
+
+            Network errors and temporary server errors (5xx, 429) are retried using PixivRetryPolicy,
+            other HTTPError are raised immediately.
+            throw PixivCircuitOpenException without sending the request if the host keeps failing.
+        '''
         if retry == 0 and self._config is not None:
             retry = self._config.retry
+        retry_state = PixivRetryPolicy.get_policy(self._config).begin(retry)
 
+        limiter = PixivRateLimiter.get_limiter(self._config)
+        breaker = PixivRetryPolicy.get_breaker(self._config)
         while True:
             res = None
             try:
-                res = self.open(url, data, timeout)
+                breaker.before_request(url)
+                if limiter is not None:
+                    limiter.acquire(url)
+                with PixivRateLimiter.slot(self._config, url):
+                    res = self.open(url, data, timeout)
+                breaker.on_success(url)
+                if limiter is not None:
+                    limiter.on_response(url, res.code)
                 return res
+            except PixivCircuitOpenException:
+                raise
             except HTTPError as fanboxError:
-                if res is not None:
-                    print(f"Error Code: {res.code}")
-                    print(f"Response Headers: {res.headers}")
-                    if res.code == '302':
-                        print(f"Redirect to {res.headers['location']}")
+                if PixivRetryPolicy.is_server_failure(fanboxError):
+                    breaker.on_failure(url)
                 else:
-                    # Issue #1342
-                    if "challenge_basic_security_FANBOX" in str(fanboxError.get_data()) and fanboxError.getcode() == 403:
-                        return fanboxError
+                    breaker.on_success(url)
+                if limiter is not None:
+                    # the limiter will also slow down the other requests to the same host class
+                    limiter.on_response(url, fanboxError.code, fanboxError.headers.get('Retry-After'))
+                # Issue #1342
+                if "challenge_basic_security_FANBOX" in str(fanboxError.get_data()) and fanboxError.getcode() == 403:
+                    return fanboxError
+                delay = retry_state.get_delay(fanboxError)
+                if delay is not None:
+                    retry_state.wait(delay, fanboxError)
+                    continue
                 raise
-            except BaseException:
-                exc_value = sys.exc_info()[1]
-                assert (self._config is not None)
-                if retry_count < retry:
-                    print(exc_value, end=' ')
-                    for t in range(1, self._config.retryWait):
-                        print(t, end=' ')
-                        PixivHelper.print_delay(2)
-                    print('')
-                    retry_count = retry_count + 1
-                else:
-                    temp = url
-                    if isinstance(url, Request):
-                        temp = url.full_url
+            except KeyboardInterrupt:
+                raise
+            except BaseException as ex:
+                if PixivRetryPolicy.is_server_failure(ex):
+                    breaker.on_failure(url)
+                delay = retry_state.get_delay(ex)
+                if delay is not None:
+                    retry_state.wait(delay, ex)
+                    continue
+
+                temp = url
+                if isinstance(url, Request):
+                    temp = url.full_url
+
+                PixivHelper.print_and_log('error', f'Error at open_with_retry(): {sys.exc_info()}')
+                raise PixivException(f"Failed to get page: {temp}, please check your internet connection/firewall/antivirus.",
+                                     errorCode=PixivException.SERVER_ERROR)
+
+    def _open_with_disk_cache(self, req, revalidate=False) -> bytes:
+        ''' open the request and return the response body.
+
+            The responses of the endpoints in PixivResponseCache.DISK_CACHE_ENDPOINTS are kept in the disk cache if useDiskCache is enabled,
+            expired responses are revalidated with If-None-Match/If-Modified-Since.
+            revalidate=True always asks the server, even if the response is not expired.
+            throw HTTPError as open_with_retry()
+        '''
+        if isinstance(req, str):
+            req = mechanize.Request(req)
+        url = req.get_full_url()
+        disk_cache = PixivResponseCache.get_disk_cache(self._config)
+        entry = disk_cache.get(url, revalidate) if disk_cache is not None else None
+        if entry is not None:
+            if entry.fresh:
+                return entry.body
+            if entry.etag is not None:
+                req.add_header('If-None-Match', entry.etag)
+            if entry.last_modified is not None:
+                req.add_header('If-Modified-Since', entry.last_modified)
 
-                    PixivHelper.print_and_log('error', f'Error at open_with_retry(): {sys.exc_info()}')
-                    raise PixivException(f"Failed to get page: {temp}, please check your internet connection/firewall/antivirus.",
-                                         errorCode=PixivException.SERVER_ERROR)
+        try:
+            res = self.open_with_retry(req)
+        except HTTPError as ex:
+            if ex.code == 304 and entry is not None:
+                PixivHelper.get_logger().debug("Not modified: %s", url)
+                disk_cache.revalidated(url)
+                return entry.body
+            raise
+        body = res.read()
+        res.close()
+        if disk_cache is not None:
+            disk_cache.put(url, body, res.info().get('ETag'), res.info().get('Last-Modified'))
+        return body
 
     # def getPixivPage(self, url, referer="https://www.pixiv.net", returnParsed=True, enable_cache=True) -> Union[str, BeautifulSoup]:
     def getPixivPage(self, url, referer="https://www.pixiv.net", enable_cache=True) -> str:
@@ -247,7 +396,8 @@ class PixivBrowser(mechanize.Browser):
             throw PixivException as server error
         '''
         url = self.fixUrl(url)
-        retry_count = 0
+        assert (self._config is not None)
+        retry_state = PixivRetryPolicy.get_policy(self._config).begin(self._config.retry)
         while True:
             req = mechanize.Request(url)
             req.add_header('Referer', referer)
@@ -256,13 +406,11 @@ class PixivBrowser(mechanize.Browser):
             if read_page is None:
                 while True:
                     try:
-                        temp = self.open_with_retry(req)
-                        assert (temp is not None)
-                        read_page = temp.read()
+                        read_page = self._open_with_disk_cache(req, revalidate=not enable_cache)
+                        size = len(read_page)
                         read_page = read_page.decode('utf8')
                         if enable_cache:
-                            self._put_to_cache(url, read_page)
-                        temp.close()
+                            self._put_to_cache(url, read_page, size=size)
                         break
                     except HTTPError as ex:
                         if ex.code in [403, 404, 503]:
@@ -271,16 +419,13 @@ class PixivBrowser(mechanize.Browser):
                         else:
                             PixivHelper.print_and_log('error', f'Error at getPixivPage(): {sys.exc_info()}')
                             raise PixivException(f"Failed to get page: {url}", errorCode=PixivException.SERVER_ERROR)
-                    except BaseException:
-                        exc_value = sys.exc_info()[1]
-                        assert (self._config is not None)
-                        if retry_count < self._config.retry:
-                            print(exc_value, end=' ')
-                            for t in range(1, self._config.retryWait):
-                                print(t, end=' ')
-                                PixivHelper.print_delay(2)
-                            print('')
-                            retry_count = retry_count + 1
+                    except (KeyboardInterrupt, PixivCircuitOpenException):
+                        raise
+                    except BaseException as ex:
+                        # open_with_retry() already retried the request, this is for the error while reading the response.
+                        delay = retry_state.get_delay(ex)
+                        if delay is not None:
+                            retry_state.wait(delay, ex)
                         else:
                             raise PixivException(f"Failed to get page: {url}", errorCode=PixivException.SERVER_ERROR)
 
@@ -663,16 +808,26 @@ class PixivBrowser(mechanize.Browser):
         else:
             # https://www.pixiv.net/artworks/unlisted/SbliQHtJS5MMu3elqDFZ
             url = f"https://www.pixiv.net{self._locale}/artworks/unlisted/{image_id}"
-        response = self.getPixivPage(url, enable_cache=False)
-        self.handleDebugMediumPage(response, image_id)
+        # the artworks page is only needed for debugging, the post info is from the ajax.
+        need_medium_page = self._config.enableDump and (self._config.dumpMediumPage or self._config.debugHttp)
+        if need_medium_page:
+            response = self.getPixivPage(url, enable_cache=False)
+            self.handleDebugMediumPage(response, image_id)
 
         # Issue #355 new ui handler
         image = None
         try:
-
-            # https://www.pixiv.net/ajax/illust/129153804?lang=en
-            js_image_info = f"https://www.pixiv.net/ajax/illust/{image_id}?lang={self._locale}"
-            response = self.getPixivPage(js_image_info, enable_cache=False)
+            (response, meta_response) = self._get_prefetched(image_id)
+            if response is None:
+                # https://www.pixiv.net/ajax/illust/129153804?lang=en
+                js_image_info = f"https://www.pixiv.net/ajax/illust/{image_id}?lang={self._locale}"
+                try:
+                    response = self.getPixivPage(js_image_info, enable_cache=False)
+                except PixivException:
+                    if not need_medium_page:
+                        # raise the error of the artworks page if it is not accessible, else log it below.
+                        response = self.getPixivPage(url, enable_cache=False)
+                    raise
             PixivHelper.print_and_log('debug', f'js_image_info = {response}')
 
             # Issue #420
@@ -694,11 +849,12 @@ class PixivBrowser(mechanize.Browser):
                                 stripHTMLTagsFromCaption=self._config.stripHTMLTagsFromCaption)
 
             if image.imageMode == "ugoira_view":
-                ugoira_meta_url = f"https://www.pixiv.net/ajax/illust/{image_id}/ugoira_meta"
-                res = self.open_with_retry(ugoira_meta_url)
-                meta_response = res.read()
+                if meta_response is None:
+                    ugoira_meta_url = f"https://www.pixiv.net/ajax/illust/{image_id}/ugoira_meta"
+                    res = self.open_with_retry(ugoira_meta_url)
+                    meta_response = res.read()
+                    res.close()
                 image.ParseUgoira(meta_response)
-                res.close()
 
             if parent is None:
                 if from_bookmark:
@@ -713,6 +869,64 @@ class PixivBrowser(mechanize.Browser):
 
         return (image, response)
 
+    def prefetchImagePages(self, image_ids):
+        ''' fetch the ajax info of the next posts in the background, consumed by getImagePage().'''
+        prefetch_count = self._config.prefetchCount if self._config is not None else 0
+        if prefetch_count <= 0:
+            return
+        executor = _get_prefetch_executor(prefetch_count)
+        if self._prefetched is None:
+            self._prefetched = OrderedDict()
+
+        for image_id in list(image_ids)[:prefetch_count]:
+            image_id = str(image_id)
+            if image_id not in self._prefetched:
+                self._prefetched[image_id] = executor.submit(self._prefetchImagePage, image_id)
+
+        # bound the memory usage, drop the oldest unused posts
+        while len(self._prefetched) > prefetch_count * 2:
+            (_, future) = self._prefetched.popitem(last=False)
+            future.cancel()
+
+    def _prefetchImagePage(self, image_id):
+        ''' best effort, getImagePage() will fetch again if failed.
+
+            Same requests as getImagePage() using the browser of the worker thread, see BrowserPool.
+        '''
+        browser = getBrowser()
+        response = browser.getPixivPage(f"https://www.pixiv.net/ajax/illust/{image_id}?lang={self._locale}",
+                                        referer=f"https://www.pixiv.net/artworks/{image_id}",
+                                        enable_cache=False)
+        meta_response = None
+        body = json.loads(response)["body"]
+        # illustType: 0 = illust, 1 = manga, 2 = ugoira, the url is not available for the restricted posts
+        if body.get("illustType") == 2:
+            res = browser.open_with_retry(f"https://www.pixiv.net/ajax/illust/{image_id}/ugoira_meta")
+            meta_response = res.read()
+            res.close()
+        return (response, meta_response)
+
+    def cancelPrefetch(self):
+        ''' cancel the prefetch which are not started yet.'''
+        if self._prefetched is None:
+            return
+        for future in self._prefetched.values():
+            future.cancel()
+        self._prefetched.clear()
+
+    def _get_prefetched(self, image_id):
+        ''' return the prefetched (ajax response, ugoira_meta response) or (None, None) if not available.'''
+        if self._prefetched is None:
+            return (None, None)
+        future = self._prefetched.pop(str(image_id), None)
+        if future is None or future.cancelled():
+            return (None, None)
+        try:
+            return future.result()
+        except BaseException as ex:
+            PixivHelper.get_logger().debug("Prefetch failed for %s: %s", image_id, ex)
+            return (None, None)
+
     def handleDebugMediumPage(self, response, imageId):
         if self._config.enableDump:
             if self._config.dumpMediumPage:
@@ -736,12 +950,9 @@ class PixivBrowser(mechanize.Browser):
                 PixivHelper.get_logger().debug("using webrpc: %s", url)
                 info = self._get_from_cache(url)
                 if info is None:
-                    request = mechanize.Request(url)
-                    res = self.open_with_retry(request)
-                    infoStr = res.read()
-                    res.close()
+                    infoStr = self._open_with_disk_cache(url)
                     info = json.loads(infoStr)
-                    self._put_to_cache(url, info)
+                    self._put_to_cache(url, info, size=len(infoStr))
             else:
                 PixivHelper.print_and_log('info', f'Using OAuth to retrieve member info for: {member_id}')
                 if not self._username or not self._password:
@@ -751,17 +962,10 @@ class PixivBrowser(mechanize.Browser):
                 info = self._get_from_cache(url)
                 if info is None:
                     PixivHelper.get_logger().debug("Getting member information: %s", member_id)
-                    login_response = self._oauth_manager.login()
-                    if login_response.status_code == 200:
-                        info = json.loads(login_response.text)
-                        if self._config.refresh_token != info["response"]["refresh_token"]:
-                            PixivHelper.print_and_log('info', 'OAuth Refresh Token is updated, updating config.ini')
-                            self._config.refresh_token = info["response"]["refresh_token"]
-                            self._config.writeConfig(path=self._config.configFileLocation)
-
                     response = self._oauth_manager.get_user_info(member_id)
+                    self._update_refresh_token()
                     info = json.loads(response.text)
-                    self._put_to_cache(url, info)
+                    self._put_to_cache(url, info, size=len(response.content))
                     PixivHelper.get_logger().debug("reply: %s", response.text)
 
             artist.ParseInfo(info, False, bookmark=bookmark)
@@ -770,11 +974,9 @@ class PixivBrowser(mechanize.Browser):
             url_ajax = f'https://www.pixiv.net/ajax/user/{member_id}'
             info_ajax = self._get_from_cache(url_ajax)
             if info_ajax is None:
-                res = self.open_with_retry(url_ajax)
-                info_ajax_str = res.read()
-                res.close()
+                info_ajax_str = self._open_with_disk_cache(url_ajax)
                 info_ajax = json.loads(info_ajax_str)
-                self._put_to_cache(url_ajax, info_ajax)
+                self._put_to_cache(url_ajax, info_ajax, size=len(info_ajax_str))
             # 2nd pass to get the background
             artist.ParseBackground(info_ajax)
 
@@ -834,9 +1036,7 @@ class PixivBrowser(mechanize.Browser):
             response = self._get_from_cache(url)
             if response is None:
                 try:
-                    res = self.open_with_retry(url)
-                    response = res.read()
-                    res.close()
+                    response = self._open_with_disk_cache(url)
                 except HTTPError as ex:
                     if ex.code == 404:
                         response = ex.read()
@@ -930,9 +1130,7 @@ class PixivBrowser(mechanize.Browser):
                             response_page = self._get_from_cache(img_url)
                             if response_page is None:
                                 try:
-                                    res = self.open_with_retry(img_url)
-                                    response_page = res.read()
-                                    res.close()
+                                    response_page = self._open_with_disk_cache(img_url)
                                 except HTTPError as ex:
                                     if ex.code == 404:
                                         response_page = ex.read()
@@ -1321,11 +1519,83 @@ class PixivBrowser(mechanize.Browser):
         return result
 
 
+class ThreadSafeCookieJar(http.cookiejar.LWPCookieJar):
+    '''LWPCookieJar which can be iterated while the other threads are adding cookies from their responses.
+
+       CookieJar already locks when adding/extracting cookies, but not when iterating.
+    '''
+    def __iter__(self):
+        with self._cookies_lock:
+            return iter(list(super().__iter__()))
+
+
+def _get_prefetch_executor(max_workers):
+    '''return the executor of the prefetch, created on first use'''
+    global _prefetch_executor
+    with _prefetch_lock:
+        if _prefetch_executor is None:
+            _prefetch_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        return _prefetch_executor
+
+
+def shutdown_prefetch():
+    '''cancel the pending prefetch and wait for the running ones, called at exit'''
+    global _prefetch_executor
+    with _prefetch_lock:
+        executor = _prefetch_executor
+        _prefetch_executor = None
+    if executor is None:
+        return
+    for browser in [_browser] + _browser_pool.get_browsers():
+        if browser is not None:
+            browser.cancelPrefetch()
+    executor.shutdown(wait=True)
+
+
+class BrowserPool(object):
+    '''Hand out one PixivBrowser per thread, mechanize.Browser keeps the history,
+       the headers and the last response, so it cannot be used by several threads at once.
+
+       The browsers share the cookie jar and the login state of the main browser,
+       the OAuth access token and the response cache are shared by all browsers.
+    '''
+    _local = None
+    _browsers = None
+
+    def __init__(self):
+        self._local = threading.local()
+        self._browsers = weakref.WeakSet()
+
+    def get(self, main_browser):
+        '''return the browser of the current thread, created on first use'''
+        browser = getattr(self._local, 'browser', None)
+        if browser is None:
+            browser = PixivBrowser(main_browser._config, main_browser.cookiejar)
+            self._local.browser = browser
+            self._browsers.add(browser)
+        elif browser._config is not main_browser._config:
+            # e.g. the batch job options
+            browser._configureBrowser(main_browser._config)
+        browser._copyLoginState(main_browser)
+        return browser
+
+    def get_browsers(self):
+        '''return the browsers of the threads which are still alive'''
+        return list(self._browsers)
+
+
+_browser_pool = BrowserPool()
+
+
 def getBrowser(config=None, cookieJar=None):
+    ''' return the main browser, or the browser of the current worker thread from the BrowserPool.'''
     global defaultCookieJar
     global defaultConfig
     global _browser
 
+    if _browser is not None and threading.current_thread() is not threading.main_thread():
+        return _browser_pool.get(_browser)
+
     if _browser is None:
         if config is not None:
             defaultConfig = config
@@ -1333,11 +1603,16 @@ def getBrowser(config=None, cookieJar=None):
             defaultCookieJar = cookieJar
         if defaultCookieJar is None:
             PixivHelper.get_logger().info("No default cookie jar available, creating... ")
-            defaultCookieJar = http.cookiejar.LWPCookieJar()
+            defaultCookieJar = ThreadSafeCookieJar()
         _browser = PixivBrowser(defaultConfig, defaultCookieJar)
     elif config is not None:
         defaultConfig = config
-        _browser._configureBrowser(config)
+        # reconfiguring replaces the mechanize handlers, which is not safe while
+        # the page download workers are using the browser, so only do it on changes.
+        if config is not _browser._config:
+            _browser._configureBrowser(config)
+        else:
+            _browser.addheaders = [('User-agent', config.useragent)]
 
     return _browser
 
@@ -1349,6 +1624,11 @@ def getExistingBrowser():
     return _browser
 
 
+def getWorkerBrowser():
+    '''return the browser of the current worker thread, see BrowserPool.'''
+    return _browser_pool.get(getExistingBrowser())
+
+
 # pylint: disable=W0612
 def get_br():
     from PixivConfig import PixivConfig
@@ -11,6 +11,8 @@ import re
 from colorama import Fore, Style
 
 import PixivHelper
+import PixivRateLimiter
+import PixivResponseCache
 
 script_path = PixivHelper.module_path()
 
@@ -19,6 +21,13 @@ def stringNotEmpty(value):
     return value is not None and len(value) > 0
 
 
+def perHostToConcurrencyLimits(value, default):
+    ''' apply the old maxConcurrentDownloadsPerHost to the file download hosts of the default concurrencyLimits '''
+    limits = PixivRateLimiter.parse_rate_limits(default)
+    limits["image"] = limits["fanbox_download"] = int(value)
+    return ",".join(f"{host_class}={int(limit)}" for (host_class, limit) in limits.items())
+
+
 class ConfigItem():
     section = None
     option = None
@@ -62,11 +71,25 @@ class PixivConfig():
         ConfigItem("Network", "timeout", 60),
         ConfigItem("Network", "retry", 3),
         ConfigItem("Network", "retryWait", 5),
+        ConfigItem("Network", "retryMaxWait", 60, restriction=lambda x: int(x) >= 0),
+        ConfigItem("Network", "retryMaxTotalTime", 300, restriction=lambda x: int(x) >= 0),
+        ConfigItem("Network", "circuitBreakerThreshold", 5, restriction=lambda x: int(x) >= 0),
+        ConfigItem("Network", "circuitBreakerCooldown", 60, restriction=lambda x: int(x) >= 0),
         ConfigItem("Network", "downloadDelay", 5),
         ConfigItem("Network", "checkNewVersion", True),
         ConfigItem("Network", "notifyBetaVersion", True),
         ConfigItem("Network", "openNewVersion", True),
         ConfigItem("Network", "enableSSLVerification", True),
+        ConfigItem("Network", "connectionPoolSize", 10, restriction=lambda x: int(x) >= 0),
+        ConfigItem("Network", "useRateLimiter", True),
+        ConfigItem("Network", "rateLimits", "pixiv=1,api=0.5,image=10,fanbox=1,fanbox_download=4,sketch=1,other=1",
+                   restriction=lambda x: all(rate > 0 for rate in PixivRateLimiter.parse_rate_limits(x).values()),
+                   error_message="Expected comma separated host_class=requests per second, e.g. pixiv=1,image=10"),
+        ConfigItem("Network", "concurrencyLimits", "pixiv=2,api=1,image=8,fanbox=2,fanbox_download=4,sketch=2,other=4",
+                   restriction=lambda x: all(limit >= 1 for limit in PixivRateLimiter.parse_rate_limits(x).values()),
+                   error_message="Expected comma separated host_class=number of concurrent requests, e.g. pixiv=2,image=8"),
+        ConfigItem("Network", "responseCacheSize", 64, restriction=lambda x: int(x) >= 0),
+        ConfigItem("Network", "enableCompression", True),
 
         ConfigItem("Debug", "logLevel", "DEBUG",
                    followup=str.upper,
@@ -104,6 +127,10 @@ class PixivConfig():
         ConfigItem("Settings", "stripHTMLTagsFromCaption", False),
         ConfigItem("Settings", "urlBlacklistRegex", ""),
         ConfigItem("Settings", "dbPath", ""),
+        ConfigItem("Settings", "useDiskCache", False),
+        ConfigItem("Settings", "diskCacheTTL", "profile=0,user=86400,illust=0,get_work=86400",
+                   restriction=lambda x: all(ttl >= 0 for ttl in PixivResponseCache.parse_disk_cache_ttl(x).values()),
+                   error_message="Expected comma separated endpoint=seconds, e.g. user=86400,illust=86400"),
         ConfigItem("Settings", "setLastModified", True),
         ConfigItem("Settings", "useLocalTimezone", False),
         ConfigItem("Settings", "defaultSketchOption", ""),
@@ -212,6 +239,7 @@ class PixivConfig():
         ConfigItem("DownloadControl", "backupOldFile", False),
         ConfigItem("DownloadControl", "dayLastUpdated", 7),
         ConfigItem("DownloadControl", "checkUpdatedLimit", 0),
+        ConfigItem("DownloadControl", "incrementalMemberSync", False),
         ConfigItem("DownloadControl", "useBlacklistTags", False),
         ConfigItem("DownloadControl", "useBlacklistTitles", False),
         ConfigItem("DownloadControl", "useBlacklistTitlesRegex", False),
@@ -222,10 +250,24 @@ class PixivConfig():
         ConfigItem("DownloadControl", "skipUnknownSize", False),
         ConfigItem("DownloadControl", "enablePostProcessing", False),
         ConfigItem("DownloadControl", "postProcessingCmd", ""),
+        ConfigItem("DownloadControl", "postProcessingWorkers", 1, restriction=lambda x: int(x) > 0),
+        ConfigItem("DownloadControl", "postProcessingQueueSize", 100, restriction=lambda x: int(x) > 0),
         ConfigItem("DownloadControl", "extensionFilter", ""),
         ConfigItem("DownloadControl", "downloadBuffer", 512, restriction=lambda x: int(x) > 0),
+        ConfigItem("DownloadControl", "progressInterval", 100, restriction=lambda x: int(x) >= 0),
+        ConfigItem("DownloadControl", "maxConcurrentDownloads", 1, restriction=lambda x: int(x) > 0),
+        ConfigItem("DownloadControl", "prefetchCount", 0, restriction=lambda x: int(x) >= 0),
+        ConfigItem("DownloadControl", "segmentedDownloadThreshold", 0, restriction=lambda x: int(x) >= 0),
+        ConfigItem("DownloadControl", "segmentedDownloadConnections", 4, restriction=lambda x: int(x) > 0),
+        ConfigItem("DownloadControl", "resumeDownload", True),
     ]
 
+    # renamed options, new option => [(old option, conversion of the old value using the new item)]
+    __renamed_items = {
+        "maxConcurrentDownloads": [("maxConcurrentPageDownloads", lambda value, item: int(value))],
+        "concurrencyLimits": [("maxConcurrentDownloadsPerHost", lambda value, item: perHostToConcurrencyLimits(value, item.default))],
+    }
+
     def __init__(self):
         for item in self.__items:
             setattr(self, item.option, item.process_value(item.default))
@@ -285,6 +327,8 @@ class PixivConfig():
                             break
                         except (configparser.NoSectionError, configparser.NoOptionError):
                             continue
+                    if value is None:
+                        value = self.__get_renamed_value(config, item)
                     if value is None:
                         raise
             except BaseException:
@@ -311,6 +355,16 @@ class PixivConfig():
 
         print('Configuration loaded.')
 
+    def __get_renamed_value(self, config, item):
+        ''' return the value of the old option if the option is renamed, it is written with the new name by writeConfig() '''
+        for (old_option, convert) in PixivConfig.__renamed_items.get(item.option, []):
+            for section in config.sections():
+                if config.has_option(section, old_option):
+                    value = convert(config.get(section, old_option), item)
+                    print(f"{old_option} is replaced by {item.option} = {value}")
+                    return value
+        return None
+
     # -UI01B------write config
     def writeConfig(self, error=False, path=None):
         '''Backup old config if exist and write updated config.ini'''
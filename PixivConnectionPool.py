@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=W0603
+import threading
+import urllib.error
+
+import requests
+import urllib3
+import urllib3.connection
+from requests.adapters import HTTPAdapter
+
+import PixivHelper
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# host => [requests, connection handshakes]
+_stats = dict()
+_stats_lock = threading.Lock()
+
+
+def _count(host, request_count=0, connection_count=0):
+    with _stats_lock:
+        stat = _stats.setdefault(host, [0, 0])
+        stat[0] += request_count
+        stat[1] += connection_count
+
+
+class _CountingHTTPConnection(urllib3.connection.HTTPConnection):
+    def connect(self):
+        _count(self.host, connection_count=1)
+        super().connect()
+
+
+class _CountingHTTPSConnection(urllib3.connection.HTTPSConnection):
+    def connect(self):
+        _count(self.host, connection_count=1)
+        super().connect()
+
+
+class _CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+_pool_classes = {"http": _CountingHTTPConnectionPool, "https": _CountingHTTPSConnectionPool}
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    '''HTTPAdapter which counts the connection handshakes per host'''
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _pool_classes
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = _pool_classes
+        return manager
+
+
+class PooledResponse(object):
+    '''Wrap the streamed requests.Response to behave like the mechanize response used by the download handler.'''
+
+    def __init__(self, response: requests.Response):
+        self._response = response
+        self._eof = False
+        self.code = response.status_code
+
+    def info(self):
+        return self._response.headers
+
+    def geturl(self):
+        return self._response.url
+
+    def read(self, size=-1):
+        data = self._response.raw.read(None if size < 0 else size)
+        if not data:
+            self._eof = True
+        return data
+
+    def readinto(self, buffer):
+        size = self._response.raw.readinto(buffer)
+        if size == 0:
+            self._eof = True
+        return size
+
+    def close(self):
+        raw = self._response.raw
+        if self._eof or raw.length_remaining == 0:
+            # body is fully read, return the connection to the pool
+            raw.release_conn()
+        else:
+            # aborted transfer, the connection cannot be reused
+            self._response.close()
+
+
+class PixivConnectionPool(object):
+    '''Keep-alive connection pool for the binary downloads, shared by the Pixiv, FANBOX and Sketch downloads.'''
+    _session = None
+    _config = None
+
+    def __init__(self, config, cookie_jar):
+        self._config = config
+        self._session = requests.Session()
+        adapter = _KeepAliveAdapter(pool_connections=10, pool_maxsize=config.connectionPoolSize, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        if cookie_jar is not None:
+            self._session.cookies = cookie_jar
+        self._session.verify = config.enableSSLVerification
+        # SOCKS proxy is applied globally to the socket module in PixivBrowser._configureBrowser()
+        if config.useProxy and not config.proxyAddress.startswith('socks'):
+            self._session.proxies = config.proxy
+
+    def open(self, url, headers=None):
+        ''' GET the url and return the response without reading the body.'''
+        _count(urllib3.util.parse_url(url).host, request_count=1)
+        # the raw body is saved as is, and the Range requests need the offsets of the uncompressed file
+        headers = dict(headers) if headers is not None else dict()
+        headers['Accept-Encoding'] = 'identity'
+        try:
+            res = self._session.get(url, headers=headers, stream=True, timeout=self._config.timeout, allow_redirects=True)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+            raise urllib.error.URLError(ex)
+
+        if res.status_code >= 400:
+            res.close()
+            raise urllib.error.HTTPError(url, res.status_code, res.reason, res.headers, None)
+        return PooledResponse(res)
+
+
+def get_pool(config, cookie_jar=None):
+    '''return the shared connection pool, or None if disabled by connectionPoolSize = 0'''
+    global _pool
+    if config is None or config.connectionPoolSize <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool._config is not config:
+            if _pool is not None:
+                _pool._session.close()
+            _pool = PixivConnectionPool(config, cookie_jar)
+    return _pool
+
+
+def get_stats():
+    '''return dict of host => (requests, connections, reuse ratio, handshakes avoided)'''
+    result = dict()
+    with _stats_lock:
+        for (host, (request_count, connection_count)) in _stats.items():
+            reused = max(request_count - connection_count, 0)
+            ratio = reused / request_count if request_count > 0 else 0
+            result[host] = (request_count, connection_count, ratio, reused)
+    return result
+
+
+def print_stats():
+    stats = get_stats()
+    if len(stats) == 0:
+        return
+    PixivHelper.print_and_log('info', 'Connection pool statistics:')
+    for (host, (request_count, connection_count, ratio, reused)) in stats.items():
+        PixivHelper.print_and_log('info', f' - {host}: {request_count} requests, {connection_count} connections, reuse ratio {ratio:.1%}, {reused} handshakes avoided')
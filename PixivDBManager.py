@@ -6,6 +6,7 @@ import os
 import re
 import sqlite3
 import sys
+import threading
 from datetime import datetime
 
 # import colorama
@@ -32,10 +33,32 @@ class PixivDBManager(object):
             PixivHelper.print_and_log(
                 'info', "Using custom DB Path: " + target)
         self.rootDirectory = root_directory
-        self.conn = sqlite3.connect(target, timeout)
+        self._target = target
+        self._timeout = timeout
+        self._local = threading.local()
+        self._connections = list()
+        self._connections_lock = threading.Lock()
+        # open the connection of the main thread, so an invalid path fails early.
+        self.conn
+
+    @property
+    def conn(self):
+        '''return the connection of the current thread, each worker thread get its own connection.'''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # still allow close() to be called from the main thread.
+            conn = sqlite3.connect(self._target, self._timeout, check_same_thread=False)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
 
     def close(self):
-        self.conn.close()
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
 
 ##########################################
 # I. Create/Drop Database                #
@@ -74,6 +97,14 @@ class PixivDBManager(object):
             except BaseException:
                 pass
 
+            # add column for the newest image_id of the last completed run, see incrementalMemberSync
+            try:
+                c.execute(
+                    '''ALTER TABLE pixiv_master_member ADD COLUMN last_sync_image INTEGER DEFAULT 0''')
+                self.conn.commit()
+            except BaseException:
+                pass
+
             c.execute('''CREATE TABLE IF NOT EXISTS pixiv_master_image (
                             image_id INTEGER PRIMARY KEY,
                             member_id INTEGER,
@@ -176,6 +207,16 @@ class PixivDBManager(object):
             self.create_update_novel_table(c)
             self.conn.commit()
 
+            # Run journal for resuming list and batch job
+            c.execute('''CREATE TABLE IF NOT EXISTS pixiv_run_journal (
+                            run_id TEXT,
+                            item_type TEXT,
+                            item_key TEXT,
+                            created_date DATE,
+                            PRIMARY KEY (run_id, item_type, item_key) ON CONFLICT IGNORE
+                            )''')
+            self.conn.commit()
+
             print('done.')
         except BaseException:
             print('Error at createDatabase():', str(sys.exc_info()))
@@ -210,6 +251,9 @@ class PixivDBManager(object):
             c.execute('''DROP TABLE IF EXISTS sketch_post_image''')
             self.conn.commit()
 
+            c.execute('''DROP TABLE IF EXISTS pixiv_run_journal''')
+            self.conn.commit()
+
         except BaseException:
             print('Error at dropDatabase():', str(sys.exc_info()))
             print('failed.')
@@ -241,7 +285,7 @@ class PixivDBManager(object):
             c = self.conn.cursor()
 
             for item in listTxt:
-                c.execute('''INSERT OR IGNORE INTO pixiv_master_member VALUES(?, ?, ?, datetime('now'), '1-1-1', -1, 0, '')''',
+                c.execute('''INSERT OR IGNORE INTO pixiv_master_member VALUES(?, ?, ?, datetime('now'), '1-1-1', -1, 0, '', 0)''',
                           (item.memberId, str(item.memberId), r'N\A'))
                 c.execute('''UPDATE pixiv_master_member
                              SET save_folder = ?
@@ -348,7 +392,7 @@ class PixivDBManager(object):
                             ORDER BY member_id''')
             filename = filename + '.csv'
             writer = codecs.open(filename, 'wb', encoding='utf-8')
-            writer.write('member_id,name,save_folder,created_date,last_update_date,last_image,is_deleted,member_token\r\n')
+            writer.write('member_id,name,save_folder,created_date,last_update_date,last_image,is_deleted,member_token,last_sync_image\r\n')
             for row in c:
                 for string in row:
                     # Unicode write!!
@@ -485,7 +529,7 @@ class PixivDBManager(object):
                     if member_id > 0:
                         break
 
-            c.execute('''INSERT OR IGNORE INTO pixiv_master_member VALUES(?, ?, ?, datetime('now'), '1-1-1', -1, 0, ?)''',
+            c.execute('''INSERT OR IGNORE INTO pixiv_master_member VALUES(?, ?, ?, datetime('now'), '1-1-1', -1, 0, ?, 0)''',
                       (member_id, str(member_id), r'N\A', member_token))
             self.conn.commit()
         except BaseException:
@@ -612,6 +656,23 @@ class PixivDBManager(object):
         finally:
             c.close()
 
+    def selectLastSyncImageByMemberId(self, member_id):
+        ''' return the newest image_id of the member when all the posts were processed, or 0 '''
+        try:
+            c = self.conn.cursor()
+            c.execute(
+                '''SELECT last_sync_image FROM pixiv_master_member WHERE member_id = ? ''', (member_id, ))
+            row = c.fetchone()
+            if row is not None and row[0] is not None:
+                return int(row[0])
+            return 0
+        except BaseException:
+            print('Error at selectLastSyncImageByMemberId():', str(sys.exc_info()))
+            print('failed')
+            raise
+        finally:
+            c.close()
+
     def updateLastDownloadedImage(self, memberId, imageId):
         try:
             c = self.conn.cursor()
@@ -626,6 +687,20 @@ class PixivDBManager(object):
         finally:
             c.close()
 
+    def updateLastSyncImage(self, memberId, imageId):
+        try:
+            c = self.conn.cursor()
+            c.execute('''UPDATE pixiv_master_member
+                         SET last_sync_image = ?
+                         WHERE member_id = ?''', (imageId, memberId))
+            self.conn.commit()
+        except BaseException:
+            print('Error at updateLastSyncImage:', str(sys.exc_info()))
+            print('failed')
+            raise
+        finally:
+            c.close()
+
     def updateLastDownloadDate(self, memberId):
         try:
             c = self.conn.cursor()
@@ -960,6 +1035,25 @@ class PixivDBManager(object):
         finally:
             c.close()
 
+    def selectDownloadedImageIds(self, image_ids):
+        ''' return the set of image_id already downloaded, using IN queries in chunks below the sqlite variable limit (999). '''
+        image_ids = [int(x) for x in image_ids]
+        result = set()
+        try:
+            c = self.conn.cursor()
+            for i in range(0, len(image_ids), 999):
+                chunk = image_ids[i:i + 999]
+                c.execute(
+                    '''SELECT image_id FROM pixiv_master_image WHERE image_id IN (%s) AND save_name != 'N/A' ''' % (",".join("?" * len(chunk)),), chunk)
+                result.update(row[0] for row in c.fetchall())
+            return result
+        except BaseException:
+            print('Error at selectDownloadedImageIds():', str(sys.exc_info()))
+            print('failed')
+            raise
+        finally:
+            c.close()
+
     def selectImageByImageIdAndPage(self, imageId, page):
         try:
             c = self.conn.cursor()
@@ -1589,6 +1683,34 @@ class PixivDBManager(object):
         finally:
             c.close()
 
+##########################################
+# IX. Run Journal                        #
+##########################################
+    def insertRunJournal(self, run_id, item_type, item_key):
+        try:
+            c = self.conn.cursor()
+            c.execute('''INSERT OR IGNORE INTO pixiv_run_journal VALUES(?, ?, ?, datetime('now'))''',
+                      (run_id, item_type, str(item_key)))
+            self.conn.commit()
+        except BaseException:
+            print('Error at insertRunJournal():', str(sys.exc_info()))
+            print('failed')
+            raise
+        finally:
+            c.close()
+
+    def selectRunJournal(self, run_id):
+        try:
+            c = self.conn.cursor()
+            c.execute('''SELECT item_type, item_key FROM pixiv_run_journal WHERE run_id = ?''', (run_id,))
+            return c.fetchall()
+        except BaseException:
+            print('Error at selectRunJournal():', str(sys.exc_info()))
+            print('failed')
+            raise
+        finally:
+            c.close()
+
 ##########################################
 # VIII. Utilities                        #
 ##########################################
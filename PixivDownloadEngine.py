@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=W0603
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import PixivConstant
+import PixivDownloadHandler
+import PixivHelper
+import PixivRateLimiter
+
+# (maxConcurrentDownloads, concurrencyLimits) => PixivDownloadEngine
+_engines = dict()
+_engine_lock = threading.Lock()
+
+
+class DownloadJob(object):
+    '''A single file to download, see PixivDownloadHandler.download_image() for the details.'''
+    url = None
+    filename = None
+    referer = None
+    image = None
+    page = None
+    overwrite = None
+    download_from = PixivConstant.DOWNLOAD_PIXIV
+
+    def __init__(self, url, filename, referer, image=None, page=None, overwrite=None, download_from=PixivConstant.DOWNLOAD_PIXIV):
+        self.url = url
+        self.filename = filename
+        self.referer = referer
+        self.image = image
+        self.page = page
+        self.overwrite = overwrite
+        self.download_from = download_from
+
+
+def download(caller, job: DownloadJob, notifier=None):
+    '''download the job in the current thread, return (result, filename) of download_image()'''
+    config = caller.__config__
+    overwrite = config.overwrite if job.overwrite is None else job.overwrite
+    return PixivDownloadHandler.download_image(caller,
+                                               job.url,
+                                               job.filename,
+                                               job.referer,
+                                               overwrite,
+                                               config.retry,
+                                               config.backupOldFile,
+                                               image=job.image,
+                                               page=job.page,
+                                               notifier=notifier,
+                                               download_from=job.download_from)
+
+
+class PixivDownloadEngine(object):
+    '''asyncio based download scheduler with global and per host class concurrency limit.
+
+       The event loop runs in its own thread, so the handlers can submit the jobs from any thread.
+       The transfers are still done by download_image() in the worker threads, to keep the same
+       skip/size/overwrite semantics.
+    '''
+    _config = None
+    _loop = None
+    _thread = None
+    _executor = None
+    _global_limit = None
+    _host_limits = None
+    _concurrency = None
+    # the settings used to build the limits, the config can be reloaded in place
+    max_concurrent_downloads = None
+
+    def __init__(self, config):
+        self._config = config
+        self.max_concurrent_downloads = config.maxConcurrentDownloads
+        self._concurrency = PixivRateLimiter.HostConcurrency(config)
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=config.maxConcurrentDownloads, thread_name_prefix="download")
+        self._loop.set_default_executor(self._executor)
+        self._host_limits = dict()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="download-engine", daemon=True)
+        self._thread.start()
+
+    async def _download(self, caller, job: DownloadJob, notifier):
+        host_class = PixivRateLimiter.get_host_class(job.url)
+        # the semaphores are created and only accessed from the event loop thread
+        if self._global_limit is None:
+            self._global_limit = asyncio.Semaphore(self.max_concurrent_downloads)
+        if host_class not in self._host_limits:
+            self._host_limits[host_class] = asyncio.Semaphore(self._concurrency.get_limit(job.url))
+        # wait in the event loop instead of blocking the worker threads, see concurrencyLimits
+        async with self._global_limit:
+            async with self._host_limits[host_class]:
+                return await self._loop.run_in_executor(None, functools.partial(download, caller, job, notifier))
+
+    def submit(self, caller, job: DownloadJob, notifier=None) -> Future:
+        '''schedule the job, the future result is the (result, filename) of download_image()'''
+        return asyncio.run_coroutine_threadsafe(self._download(caller, job, notifier), self._loop)
+
+    def shutdown(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        self._loop.close()
+
+
+def get_engine(config):
+    '''return the shared download engine, or None if maxConcurrentDownloads is 1 (download inline)
+
+       The engines are kept by their settings, so a job config with different limits gets its own engine
+       while the other parallel workers are still downloading using the previous one.
+    '''
+    if config is None or config.maxConcurrentDownloads <= 1:
+        return None
+    key = (config.maxConcurrentDownloads, config.concurrencyLimits)
+    with _engine_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            PixivHelper.get_logger().info(f"Starting download engine: {config.maxConcurrentDownloads} downloads, per host class: {config.concurrencyLimits}.")
+            engine = PixivDownloadEngine(config)
+            _engines[key] = engine
+    return engine
+
+
+def shutdown():
+    with _engine_lock:
+        for engine in _engines.values():
+            engine.shutdown()
+        _engines.clear()
@@ -2,21 +2,25 @@
 import codecs
 import gc
 import os
-import shlex
-import subprocess
 import sys
+import threading
 import time
 import traceback
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 
 import mechanize
 
 import PixivBrowserFactory
 import PixivConfig
+import PixivConnectionPool
 import PixivConstant
 import PixivHelper
+import PixivPostProcessor
+import PixivRateLimiter
+import PixivRetryPolicy
 from PixivDBManager import PixivDBManager
-from PixivException import PixivException
+from PixivException import PixivCircuitOpenException, PixivException
 
 
 def download_image(caller,
@@ -31,6 +35,22 @@ def download_image(caller,
                    notifier=None,
                    download_from=PixivConstant.DOWNLOAD_PIXIV):
     '''return download result and filename if ok'''
+    # hold the host class slot for the whole transfer, see concurrencyLimits
+    with PixivRateLimiter.slot(caller.__config__, url):
+        return _download_image(caller, url, filename, referer, overwrite, max_retry, backup_old_file, image, page, notifier, download_from)
+
+
+def _download_image(caller,
+                    url,
+                    filename,
+                    referer,
+                    overwrite,
+                    max_retry,
+                    backup_old_file=False,
+                    image=None,
+                    page=None,
+                    notifier=None,
+                    download_from=PixivConstant.DOWNLOAD_PIXIV):
     # caller function/method
     # TODO: ideally to be removed or passed as argument
     db: PixivDBManager = caller.__dbManager__
@@ -41,6 +61,7 @@ def download_image(caller,
 
     temp_error_code = None
     retry_count = 0
+    retry_state = PixivRetryPolicy.get_policy(config).begin(max_retry)
 
     # Issue #548
     filename_save = filename
@@ -82,8 +103,21 @@ def download_image(caller,
                         return (PixivConstant.PIXIVUTIL_SKIP_DUPLICATE, filename_save)
 
                 if is_exists:
-                    remote_file_size = get_remote_filesize(url, referer, config, notifier)
+                    # open the actual download and check the headers, instead of sending a separate HEAD request.
+                    # the body is only transferred if the file need to be downloaded.
+                    try:
+                        opened = open_download(url, filename_save, config, referer)
+                        (res, remote_file_size, _) = opened
+                    except urllib.error.HTTPError as ex:
+                        # fix Issue #503
+                        if int(ex.code) not in (404, 500):
+                            raise
+                        PixivHelper.print_and_log('info', "\rNo file size information!")
+                        opened = None
+                        remote_file_size = -1
+                    PixivHelper.print_and_log(None, f"\rRemote filesize = {PixivHelper.size_in_str(remote_file_size)} ({remote_file_size} Bytes)")
                 else:
+                    opened = None
                     remote_file_size = -1
                     # PixivHelper.print_and_log(None, "\rSkipped getting remote file size because local file not exists")
 
@@ -176,28 +210,20 @@ def download_image(caller,
 
                 # actual download
                 notifier(type="DOWNLOAD", message=f"Start downloading {url} to {filename_save}")
-                (downloadedSize, filename_save) = perform_download(url, remote_file_size, filename_save, overwrite, config, referer)
+                hash_methods = [method for method in ("md5", "sha1", "sha256") if filename_save.find(f"%{method}%") > 0]
+                (downloadedSize, filename_save, hashes) = perform_download(url, remote_file_size, filename_save, overwrite, config, referer,
+                                                                           opened=opened, hash_methods=hash_methods)
+                opened = None
+                res = None
 
                 # double check after download, because the file might be deleted due to partial download
                 is_exists = os.path.isfile(filename_save)
 
-                # Issue #956 need to calculate hash file for each method
+                # Issue #956 need to calculate hash file for each method, already calculated during download
                 old_filename_save = filename_save
-                if filename_save.find("%md5%") > 0:
-                    PixivHelper.print_and_log('info', 'Calculating md5...', end="")
-                    hash_str = PixivHelper.get_hash(filename_save)
-                    PixivHelper.print_and_log('info', f" => {hash_str}")
-                    filename_save = filename_save.replace("%md5%", hash_str)
-                if filename_save.find("%sha1%") > 0:
-                    PixivHelper.print_and_log('info', 'Calculating sha1...', end="")
-                    hash_str = PixivHelper.get_hash(filename_save, "sha1")
-                    PixivHelper.print_and_log('info', f" => {hash_str}")
-                    filename_save = filename_save.replace("%sha1%", hash_str)
-                if filename_save.find("%sha256%") > 0:
-                    PixivHelper.print_and_log('info', 'Calculating sha256...', end="")
-                    hash_str = PixivHelper.get_hash(filename_save, "sha256")
-                    PixivHelper.print_and_log('info', f" => {hash_str}")
-                    filename_save = filename_save.replace("%sha256%", hash_str)
+                for method in hash_methods:
+                    PixivHelper.print_and_log('info', f"{method} => {hashes[method]}")
+                    filename_save = filename_save.replace(f"%{method}%", hashes[method])
                 if not os.path.exists(filename_save) and os.path.exists(old_filename_save):
                     os.rename(old_filename_save, filename_save)
 
@@ -212,7 +238,7 @@ def download_image(caller,
                     if retry_count < max_retry:
                         retry_count = retry_count + 1
                         PixivHelper.print_and_log(None, f"\rRetrying [{retry_count}]...", newline=False)
-                        PixivHelper.print_delay(config.retryWait)
+                        PixivHelper.print_delay(round(retry_state.backoff()))
                         continue
                     return (PixivConstant.DOWNLOAD_FAILED_OTHER, filename_save)
 
@@ -281,8 +307,8 @@ def download_image(caller,
                 # Issue #970
                 if config.enablePostProcessing and len(config.postProcessingCmd) > 0:
                     cmd = config.postProcessingCmd.replace("%filename%", filename_save)
-                    PixivHelper.print_and_log('info', f'Running post processing command: {cmd}')
-                    subprocess.Popen(shlex.split(cmd), startupinfo=None)
+                    PixivHelper.print_and_log('info', f'Queueing post processing command: {cmd}')
+                    PixivPostProcessor.get_processor(config).submit(cmd)
 
                 return (PixivConstant.PIXIVUTIL_OK, filename_save)
 
@@ -297,7 +323,7 @@ def download_image(caller,
                 temp_error_code = PixivException.DOWNLOAD_FAILED_NETWORK
                 raise
             except IOError as ioex:
-                if ioex.errno == 28:
+                if ioex.errno == 28 and PixivHelper.is_main_thread():
                     PixivHelper.print_and_log('error', str(ioex))
                     input("Press Enter to retry.")
                     continue
@@ -308,10 +334,14 @@ def download_image(caller,
                 return (PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT, None)
             finally:
                 if res is not None:
+                    # skipped or failed before the body is read, abort the transfer.
+                    res.close()
                     del res
                 if req is not None:
                     del req
 
+        except PixivCircuitOpenException:
+            raise
         except BaseException:
             if temp_error_code is None:
                 temp_error_code = PixivException.DOWNLOAD_FAILED_OTHER
@@ -323,35 +353,209 @@ def download_image(caller,
             if retry_count < max_retry:
                 retry_count = retry_count + 1
                 PixivHelper.print_and_log(None, f"\rRetrying [{retry_count}]...", newline=False)
-                PixivHelper.print_delay(config.retryWait)
+                PixivHelper.print_delay(round(retry_state.backoff()))
             else:
                 raise
 
 
-def perform_download(url, file_size, filename, overwrite, config, referer=None, notifier=None):
+def _open_url(url, headers, config, referer):
+    '''GET the url with the extra headers using the connection pool if enabled'''
+    br = PixivBrowserFactory.getBrowser(config=config)
+    pool = PixivConnectionPool.get_pool(config, br.cookiejar)
+    limiter = PixivRateLimiter.get_limiter(config)
+    breaker = PixivRetryPolicy.get_breaker(config)
+    breaker.before_request(url)
+    if limiter is not None:
+        limiter.acquire(url)
+    try:
+        if pool is not None:
+            headers['User-Agent'] = config.useragent
+            res = pool.open(url, headers)
+        else:
+            req = PixivHelper.create_custom_request(url, config, referer)
+            for (name, value) in headers.items():
+                req.add_header(name, value)
+            res = br.open_novisit(req)
+    except urllib.error.HTTPError as ex:
+        if PixivRetryPolicy.is_server_failure(ex):
+            breaker.on_failure(url)
+        else:
+            breaker.on_success(url)
+        if limiter is not None:
+            limiter.on_response(url, ex.code, ex.headers.get('Retry-After'))
+        raise
+    except BaseException as ex:
+        if PixivRetryPolicy.is_server_failure(ex):
+            breaker.on_failure(url)
+        raise
+    breaker.on_success(url)
+    if limiter is not None:
+        limiter.on_response(url, res.code)
+    return res
+
+
+def open_download(url, filename, config, referer=None):
+    '''open the download request, return the response, remote file size and the resumed offset'''
+    if referer is None:
+        referer = config.referer
+
+    def open_url(headers):
+        return _open_url(url, headers, config, referer)
+
+    # resume the partial .pixiv file if the validator is still the same
+    headers = {'Referer': referer}
+    resume_from = 0
+    if config.resumeDownload:
+        (resume_from, validator) = PixivHelper.get_resume_validator(filename)
+        if resume_from > 0:
+            PixivHelper.print_and_log(None, f'\rResuming download from {PixivHelper.size_in_str(resume_from)}...', newline=False)
+            headers['Range'] = f'bytes={resume_from}-'
+            headers['If-Range'] = validator
+
+    try:
+        res = open_url(headers)
+    except urllib.error.HTTPError as ex:
+        if resume_from == 0 or ex.code != 416:
+            raise
+        # range not satisfiable, the partial file is not usable anymore
+        PixivHelper.print_and_log('info', '\rCannot resume, restarting download...')
+        PixivHelper.set_resume_validator(filename, None)
+        resume_from = 0
+        res = open_url({'Referer': referer})
+
+    file_size = -1
+    if resume_from > 0:
+        # server ignored the range or the file has changed, restart from the beginning
+        content_range = res.info().get('Content-Range')
+        if res.code != 206 or content_range is None or not content_range.startswith(f'bytes {resume_from}-'):
+            PixivHelper.print_and_log('info', '\rServer did not resume the download, restarting...')
+            resume_from = 0
+        else:
+            try:
+                file_size = int(content_range.rsplit('/', 1)[1])
+            except ValueError:
+                file_size = -1
+
+    if resume_from == 0:
+        content_length = res.info().get('Content-Length')
+        if content_length is not None:
+            file_size = int(content_length)
+        else:
+            PixivHelper.print_and_log('info', "\tNo file size information!")
+
+    return (res, file_size, resume_from)
+
+
+def perform_download(url, file_size, filename, overwrite, config, referer=None, notifier=None, opened=None, hash_methods=None):
     if notifier is None:
         notifier = PixivHelper.dummy_notifier
 
-    if referer is None:
-        referer = config.referer
     # actual download
     # PixivHelper.print_and_log(None, '\rStart downloading...', newline=False)
-    # fetch filesize
-    req = PixivHelper.create_custom_request(url, config, referer)
-    br = PixivBrowserFactory.getBrowser(config=config)
-    res = br.open_novisit(req)
+    if opened is None:
+        opened = open_download(url, filename, config, referer)
+    (res, remote_file_size, resume_from) = opened
     if file_size < 0:  # final check before download for download progress bar.
-        try:
-            content_length = res.info()['Content-Length']
-            if content_length is not None:
-                file_size = int(content_length)
-        except KeyError:
-            file_size = -1
-            PixivHelper.print_and_log('info', "\tNo file size information!")
-    (downloadedSize, filename) = PixivHelper.download_image(url, filename, res, file_size, overwrite)
-    res.close()
+        file_size = remote_file_size
+
+    # big files are downloaded in parallel byte ranges over the connection pool
+    if (config.segmentedDownloadThreshold > 0 and
+            resume_from == 0 and
+            file_size >= config.segmentedDownloadThreshold * 1024 * 1024 and
+            res.info().get('Accept-Ranges') == 'bytes' and
+            PixivConnectionPool.get_pool(config, PixivBrowserFactory.getBrowser(config=config).cookiejar) is not None):
+        res.close()
+        result = perform_segmented_download(url, file_size, filename, overwrite, config, referer, hash_methods)
+        gc.collect()
+        return result
+
+    if config.resumeDownload and resume_from == 0:
+        PixivHelper.set_resume_validator(filename, res.info().get('ETag') or res.info().get('Last-Modified'))
+    try:
+        (downloadedSize, filename, hashes) = PixivHelper.download_image(url, filename, res, file_size, overwrite, resume_from, hash_methods)
+    finally:
+        res.close()
     gc.collect()
-    return (downloadedSize, filename)
+    return (downloadedSize, filename, hashes)
+
+
+def perform_segmented_download(url, file_size, filename, overwrite, config, referer=None, hash_methods=None):
+    '''download the file in segmentedDownloadConnections byte ranges into a preallocated file, same return value as PixivHelper.download_image()'''
+    if referer is None:
+        referer = config.referer
+    start_time = time.time()
+    connections = config.segmentedDownloadConnections
+    segment_size = -(-file_size // connections)
+    segments = [(start, min(start + segment_size, file_size) - 1) for start in range(0, file_size, segment_size)]
+    PixivHelper.print_and_log(None, f'\rDownloading in {len(segments)} segments...')
+
+    PixivHelper.makeSubdirs(filename)
+    temp_filename = filename + '.pixiv'
+    with open(temp_filename, 'wb') as save:
+        save.truncate(file_size)
+
+    progress = 0  # downloaded bytes
+    progress_lock = threading.Lock()
+    buffer_size = config.downloadBuffer * 1024
+
+    def download_segment(start, end):
+        nonlocal progress
+        res = _open_url(url, {'Referer': referer, 'Range': f'bytes={start}-{end}'}, config, referer)
+        try:
+            content_range = res.info().get('Content-Range')
+            if res.code != 206 or content_range is None or not content_range.startswith(f'bytes {start}-{end}/'):
+                raise PixivException(f"Server did not return the requested range {start}-{end} for: {url}",
+                                     errorCode=PixivException.DOWNLOAD_FAILED_NETWORK)
+            curr = start
+            with open(temp_filename, 'r+b') as save:
+                save.seek(start)
+                while curr <= end:
+                    chunk = res.read(min(buffer_size, end + 1 - curr))
+                    if not chunk:
+                        break
+                    save.write(chunk)
+                    curr = curr + len(chunk)
+                    with progress_lock:
+                        progress = progress + len(chunk)
+                        PixivHelper.update_progress(filename, progress, file_size, force=(progress == file_size))
+            if curr != end + 1:
+                raise PixivException(f"Segment {start}-{end} incomplete ({curr - start} Bytes) for: {url}",
+                                     errorCode=PixivException.DOWNLOAD_FAILED_NETWORK)
+        finally:
+            res.close()
+
+    completed = False
+    try:
+        with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix="segment") as executor:
+            futures = [executor.submit(download_segment, start, end) for (start, end) in segments]
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        # verify the total size
+        downloaded_size = os.path.getsize(temp_filename)
+        if progress != file_size or downloaded_size != file_size:
+            PixivHelper.print_and_log('error', f'Downloaded file incomplete! {progress:9} of {file_size:9} Bytes')
+            return (progress, filename, dict())
+        total_time = time.time() - start_time
+        PixivHelper.print_and_log(None, f' Completed in {total_time:.3f}s ({PixivHelper.speed_in_str(file_size, total_time)})')
+
+        hashes = dict()
+        for method in hash_methods or []:
+            hashes[method] = PixivHelper.get_hash(temp_filename, method)
+
+        if overwrite and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(temp_filename, filename)
+        completed = True
+        return (file_size, filename, hashes)
+    finally:
+        PixivHelper.end_progress(filename)
+        if not completed and os.path.exists(temp_filename):
+            os.remove(temp_filename)
 
 
 # issue #299
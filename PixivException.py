@@ -29,6 +29,7 @@ class PixivException(BaseException):
     DOWNLOAD_FAILED_IO = 9001
     DOWNLOAD_FAILED_NETWORK = 9002
     SERVER_ERROR = 9005
+    SERVER_UNAVAILABLE = 9006
 
     MISSING_CONFIG = 9901
     OTHER_ERROR = 9999
@@ -47,3 +48,13 @@ class PixivException(BaseException):
         # return str(self.errorCode) + " " + repr(self.value)
         has_page = "Y" if self.htmlPage is not None and len(self.htmlPage) > 0 else "N"
         return f"PixivException({self.errorCode} {self.value}, hasDumpPage={has_page})"
+
+
+class PixivCircuitOpenException(PixivException):
+    '''the host failed too many times, the request is not sent. See PixivRetryPolicy.CircuitBreaker'''
+    host = None
+
+    def __init__(self, host, retry_in):
+        self.host = host
+        super(PixivCircuitOpenException, self).__init__(f"{host} is not responding, skipping the requests for {retry_in:.0f}s",
+                                                        errorCode=PixivException.SERVER_UNAVAILABLE)
@@ -4,6 +4,7 @@ import os
 import datetime_z
 import PixivBrowserFactory
 import PixivConstant
+import PixivDownloadEngine
 import PixivDownloadHandler
 import PixivHelper
 import PixivModelFanbox
@@ -61,8 +62,7 @@ def process_fanbox_artist_by_id(caller, config, artist_id, end_page, title_prefi
                 try:
                     process_fanbox_post(caller, config, post, artist)
                 except KeyboardInterrupt:
-                    choice = input("Keyboard Interrupt detected, continue to next post? (Y/N)").rstrip("\r")
-                    if choice.upper() == 'N':
+                    if not PixivHelper.ask_continue("Keyboard Interrupt detected, continue to next post? (Y/N)"):
                         PixivHelper.print_and_log("info", f"FANBOX artist: {artist}, processing aborted")
                         return
                     else:
@@ -158,6 +158,7 @@ def process_fanbox_post(caller, config, post: PixivModelFanbox.FanboxPost, artis
         else:
             current_page = 0
             print("Image Count = {0}".format(len(post.images)))
+            jobs = list()
             for image_url in post.images:
                 # fake the image_url for filename compatibility, add post id and pagenum
                 fake_image_url = image_url.replace("{0}/".format(post.imageId),
@@ -182,27 +183,42 @@ def process_fanbox_post(caller, config, post: PixivModelFanbox.FanboxPost, artis
                 print("Downloading image {0} from {1}".format(current_page, image_url))
                 print("Saved to {0}".format(filename))
 
-                # filesize detection and overwrite issue
-                _oldvalue = config.alwaysCheckFileSize
-                config.alwaysCheckFileSize = False
-                (result, filename) = PixivDownloadHandler.download_image(caller,
-                                                                         image_url,
-                                                                         filename,
-                                                                         referer,
-                                                                         False,  # config.overwrite somehow unable to get remote filesize
-                                                                         config.retry,
-                                                                         config.backupOldFile,
-                                                                         image=post,
-                                                                         page=current_page,
-                                                                         download_from=PixivConstant.DOWNLOAD_FANBOX)
-                if result == PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT:
-                    raise KeyboardInterrupt()
-                post_files.append((post.imageId, current_page, filename))
-
-                PixivHelper.get_logger().debug("Download %s result: %s", filename, result)
+                jobs.append(PixivDownloadEngine.DownloadJob(image_url,
+                                                            filename,
+                                                            referer,
+                                                            image=post,
+                                                            page=current_page,
+                                                            overwrite=False,  # config.overwrite somehow unable to get remote filesize
+                                                            download_from=PixivConstant.DOWNLOAD_FANBOX))
+                current_page = current_page + 1
 
+            # filesize detection and overwrite issue
+            _oldvalue = config.alwaysCheckFileSize
+            config.alwaysCheckFileSize = False
+            try:
+                engine = PixivDownloadEngine.get_engine(config) if len(jobs) > 1 else None
+                if engine is not None:
+                    futures = [engine.submit(caller, job) for job in jobs]
+                else:
+                    futures = [None] * len(jobs)
+                try:
+                    # keep the files in page order
+                    for (job, future) in zip(jobs, futures):
+                        if future is not None:
+                            (result, filename) = future.result()
+                        else:
+                            (result, filename) = PixivDownloadEngine.download(caller, job)
+                        if result == PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT:
+                            raise KeyboardInterrupt()
+                        post_files.append((post.imageId, job.page, filename))
+
+                        PixivHelper.get_logger().debug("Download %s result: %s", filename, result)
+                finally:
+                    for future in futures:
+                        if future is not None:
+                            future.cancel()
+            finally:
                 config.alwaysCheckFileSize = _oldvalue
-                current_page = current_page + 1
 
         # Implement #447
         filename = PixivHelper.make_filename(config.filenameFormatFanboxInfo,
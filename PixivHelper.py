@@ -15,6 +15,7 @@ import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import traceback
 import unicodedata
@@ -40,6 +41,15 @@ from PixivModelFanbox import FanboxArtist, FanboxPost
 
 __logger = None
 _config = None
+
+# download progress, see update_progress()
+_progress = dict()
+_progress_lock = threading.Lock()
+_progress_last_render = 0.0
+_progress_msg_length = 80
+
+# per thread buffer for download_image()
+_read_buffer = threading.local()
 __re_manga_index = re.compile(r'_p(\d+)')
 __badchars__ = None
 if platform.system() == 'Windows':
@@ -351,17 +361,19 @@ def make_filename(nameFormat: str,
 
 
 # Issue #956
-def get_hash(path: str, method="md5") -> str:
-    hash_str = ""
-    hash_method = None
+def get_hash_method(method="md5"):
     if method == "md5":
-        hash_method = md5
+        return md5
     elif method == "sha1":
-        hash_method = sha1
+        return sha1
     elif method == "sha256":
-        hash_method = sha256
-    else:
-        raise PixivException(msg=f"Invalid hash function {method}")
+        return sha256
+    raise PixivException(msg=f"Invalid hash function {method}")
+
+
+def get_hash(path: str, method="md5") -> str:
+    hash_str = ""
+    hash_method = get_hash_method(method)
 
     with open(path) as file, mmap(file.fileno(), 0, access=ACCESS_READ) as file:
         hash_str = hash_method(file).hexdigest()
@@ -749,6 +761,25 @@ def print_delay(retry_wait):
     print_and_log(None, "")
 
 
+def is_main_thread():
+    '''only the main thread can read the console, the parallel workers must not prompt'''
+    return threading.current_thread() is threading.main_thread()
+
+
+def ask_continue(prompt):
+    '''ask the user to continue after Ctrl+C, the worker threads always abort'''
+    if not is_main_thread():
+        return False
+    choice = input(prompt).rstrip("\r")
+    return choice.upper() != 'N'
+
+
+def wait_for_user(prompt):
+    '''wait for enter before continuing, the worker threads do not wait'''
+    if is_main_thread():
+        input(prompt)
+
+
 def create_custom_request(url, config, referer='https://www.pixiv.net', head=False):
     if config.useProxy:
         proxy = urllib.request.ProxyHandler(config.proxy)
@@ -774,47 +805,105 @@ def makeSubdirs(filename):
         os.makedirs(directory)
 
 
-def download_image(url, filename, res, file_size, overwrite):
-    ''' Actual download, return the downloaded filesize and saved filename.'''
+def get_resume_validator(filename):
+    '''return the (size, validator) of the partial download kept for filename, or (0, None)'''
+    partial_name = filename + '.pixiv'
+    validator_name = partial_name + '.resume'
+    if not os.path.isfile(partial_name) or not os.path.isfile(validator_name):
+        return (0, None)
+    with open(validator_name, 'r', encoding='utf-8') as f:
+        validator = f.readline().strip()
+    if len(validator) == 0:
+        return (0, None)
+    return (os.path.getsize(partial_name), validator)
+
+
+def set_resume_validator(filename, validator):
+    '''keep the ETag/Last-Modified of the download, so the partial file can be resumed'''
+    validator_name = filename + '.pixiv.resume'
+    if validator is None:
+        if os.path.isfile(validator_name):
+            os.remove(validator_name)
+        return
+    makeSubdirs(filename)
+    with open(validator_name, 'w', encoding='utf-8') as f:
+        f.write(validator)
+
+
+def download_image(url, filename, res, file_size, overwrite, resume_from=0, hash_methods=None):
+    ''' Actual download, return the downloaded filesize, saved filename and the hex digests of hash_methods.'''
     start_time = datetime.now()
     global _config
     BUFFER_SIZE = _config.downloadBuffer * 1024
+    remaining = file_size - resume_from if file_size > 0 else -1
+
+    # append to the partial .pixiv file if resuming, see PixivDownloadHandler.perform_download()
+    mode = 'ab+' if resume_from > 0 else 'wb+'
 
     # try to save to the given filename + .pixiv extension if possible
     try:
         makeSubdirs(filename)
-        save = open(filename + '.pixiv', 'wb+', 4096)
+        save = open(filename + '.pixiv', mode, BUFFER_SIZE)
     except IOError as ex:
         print_and_log('error', f"Error at download_image(): Cannot save {url} to {filename}: {sys.exc_info()}", exception=ex)
-        input("Press enter to continue or Ctrl+C to abort.")  # Issue #1187
+        wait_for_user("Press enter to continue or Ctrl+C to abort.")  # Issue #1187
 
         # get the actual server filename and use it as the filename for saving to current app dir
         filename = os.path.split(url)[1]
         filename = filename.split("?")[0]
         filename = sanitize_filename(filename)
-        save = open(filename + '.pixiv', 'wb+', 4096)
+        resume_from = 0
+        save = open(filename + '.pixiv', 'wb+', BUFFER_SIZE)
         print_and_log('info', f'File is saved to {filename}')
 
+    # calculate the hashes while downloading, including the resumed part
+    hashes = dict()
+    for method in hash_methods or []:
+        hashes[method] = get_hash_method(method)()
+    save.seek(0)
+    if len(hashes) > 0 and resume_from > 0:
+        while True:
+            chunk = save.read(BUFFER_SIZE)
+            if not chunk:
+                break
+            for hash_obj in hashes.values():
+                hash_obj.update(chunk)
+
     # download the file
-    prev = 0
-    curr = 0
-    msg_len = 0
+    save.seek(0, os.SEEK_END)
+    prev = resume_from
+    curr = resume_from
+    # read directly into the reusable buffer if supported
+    readinto = getattr(res, 'readinto', None)
+    read_size = get_read_size(BUFFER_SIZE, BUFFER_SIZE, remaining)
     try:
         while True:
-            save.write(res.read(BUFFER_SIZE))
-            curr = save.tell()
-            msg_len = print_progress(curr, file_size, msg_len)
+            read_start = time.monotonic()
+            if readinto is not None:
+                view = get_read_buffer(read_size)
+                chunk = view[:readinto(view)]
+            else:
+                chunk = res.read(read_size)
+            read_time = time.monotonic() - read_start
+            save.write(chunk)
+            for hash_obj in hashes.values():
+                hash_obj.update(chunk)
+            curr = curr + len(chunk)
+            update_progress(filename, curr, file_size)
+            read_size = get_read_size(BUFFER_SIZE, read_size, file_size - curr if file_size > 0 else -1, len(chunk), read_time)
 
             # check if downloaded file is complete
             if file_size > 0 and curr == file_size:
+                update_progress(filename, curr, file_size, force=True)
                 total_time = (datetime.now() - start_time).total_seconds()
-                print_and_log(None, f' Completed in {Fore.CYAN}{total_time}{Style.RESET_ALL}s ({Fore.RED}{speed_in_str(file_size, total_time)}{Style.RESET_ALL})')
+                print_and_log(None, f' Completed in {Fore.CYAN}{total_time}{Style.RESET_ALL}s ({Fore.RED}{speed_in_str(file_size - resume_from, total_time)}{Style.RESET_ALL})')
                 break
 
             # no file size info
             elif file_size < 0 and curr == prev:
+                update_progress(filename, curr, file_size, force=True)
                 total_time = (datetime.now() - start_time).total_seconds()
-                print_and_log(None, f' Completed in {Fore.CYAN}{total_time}{Style.RESET_ALL}s ({Fore.RED}{speed_in_str(curr, total_time)}{Style.RESET_ALL})')
+                print_and_log(None, f' Completed in {Fore.CYAN}{total_time}{Style.RESET_ALL}s ({Fore.RED}{speed_in_str(curr - resume_from, total_time)}{Style.RESET_ALL})')
                 break
 
             # incomplete download
@@ -829,10 +918,11 @@ def download_image(url, filename, res, file_size, overwrite):
 
     except OSError as ex:
         print_and_log('error', f"Error at download_image(): Cannot save {url} to {filename}: {sys.exc_info()}", exception=ex)
-        input("Press enter to continue or Ctrl+C to abort.")  # Issue #1187
+        wait_for_user("Press enter to continue or Ctrl+C to abort.")  # Issue #1187
         raise
 
     finally:
+        end_progress(filename)
         if save is not None:
             save.close()
 
@@ -850,19 +940,144 @@ def download_image(url, filename, res, file_size, overwrite):
             print_and_log('error', f'URL      = {url}')
             completed = False
 
+        (_, validator) = get_resume_validator(filename)
         if completed:
+            set_resume_validator(filename, None)
             if overwrite and os.path.exists(filename):
                 os.remove(filename)
             os.rename(filename + '.pixiv', filename)
+        elif validator is not None and curr > 0:
+            # keep the partial file, the next attempt will continue from here
+            print_and_log('info', f'Partial download kept for resuming: {curr} Bytes')
         else:
+            set_resume_validator(filename, None)
             os.remove(filename + '.pixiv')
 
         del save
 
-    return (curr, filename)
+    return (curr, filename, {method: hash_obj.hexdigest() for (method, hash_obj) in hashes.items()})
+
+
+def get_read_size(buffer_size, read_size, remaining, received=0, read_time=0.0):
+    ''' adapt the next read size to the throughput: double if the last read was filled quickly, halve if slow.
+
+        Limited to 1/8 - 16x of downloadBuffer and the remaining size, so small files are read in one go.
+    '''
+    if received >= read_size and read_time < 0.1:
+        read_size = read_size * 2
+    elif read_time > 0.5:
+        read_size = read_size // 2
+    read_size = max(buffer_size // 8, min(buffer_size * 16, read_size))
+    if remaining > 0:
+        read_size = min(read_size, remaining)
+    return read_size
+
+
+def get_read_buffer(size) -> memoryview:
+    ''' return a reusable buffer of the given size for the current thread.'''
+    buffer = getattr(_read_buffer, 'buffer', None)
+    if buffer is None or len(buffer) < size:
+        buffer = bytearray(size)
+        _read_buffer.buffer = buffer
+    return memoryview(buffer)[:size]
+
+
+class WorkerOutput(object):
+    '''Replacement of sys.stdout for the parallel workers.
+
+       The output of each worker thread is written line by line with the worker prefix,
+       so the lines from different workers are not mixed. The progress bar is not redrawn,
+       only the last state is kept in the line, the other text of the line is kept as is.
+    '''
+    stream = None
+    _re_progress = re.compile(r'^(\x1B\[[0-9;]*m)*\[')
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def set_prefix(self, prefix=None):
+        '''set the prefix of the current thread, None to flush the pending output and write as is'''
+        pending = getattr(self._local, 'pending', '')
+        if len(pending) > 0:
+            self._write_lines([pending])
+        self._local.pending = ''
+        self._local.prefix = prefix
+
+    def _collapse(self, line):
+        '''split the line by \\r, the consecutive redraws of the progress bar are replaced by the last one'''
+        segments = list()
+        for segment in line.split('\r'):
+            if len(segments) > 0 and \
+               (len(segments[-1].strip()) == 0 or
+                    (self._re_progress.match(segment) and self._re_progress.match(segments[-1]))):
+                segments[-1] = segment
+            else:
+                segments.append(segment)
+        return segments
+
+    def _write_lines(self, lines):
+        prefix = getattr(self._local, 'prefix', None) or ''
+        with self._lock:
+            for line in lines:
+                line = " ".join(x.rstrip() for x in self._collapse(line) if len(x.strip()) > 0)
+                self.stream.write(f"{prefix}{line}\n" if len(line) > 0 else "\n")
+
+    def write(self, text):
+        if getattr(self._local, 'prefix', None) is None:
+            with self._lock:
+                return self.stream.write(text)
+        lines = (self._local.pending + text).split('\n')
+        # keep the unterminated line short while the progress bar is redrawn
+        self._local.pending = '\r'.join(self._collapse(lines.pop()))
+        if len(lines) > 0:
+            self._write_lines(lines)
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def update_progress(key, curr, total, force=False):
+    ''' record the progress of the download and redraw at most every progressInterval ms.
+
+        When several files are downloading at the same time, the total of all of them is shown.
+        Nothing is shown if the output is not a terminal.
+    '''
+    global _progress_last_render
+    global _progress_msg_length
+    # checked on each call, sys.stdout is replaced by WorkerOutput for the parallel workers
+    if sys.stdout is None or not sys.stdout.isatty():
+        return
+    with _progress_lock:
+        _progress[key] = (curr, total)
+        now = time.monotonic()
+        interval = _config.progressInterval / 1000 if _config is not None else 0
+        if not force and now - _progress_last_render < interval:
+            return
+        _progress_last_render = now
+
+        if len(_progress) == 1:
+            _progress_msg_length = print_progress(curr, total, _progress_msg_length)
+        else:
+            items = list(_progress.values())
+            total_curr = sum(item[0] for item in items)
+            # indeterminate if any of the file size is unknown
+            total_size = -1 if any(item[1] <= 0 for item in items) else sum(item[1] for item in items)
+            _progress_msg_length = print_progress(total_curr, total_size, _progress_msg_length, suffix=f" ({len(items)} files)")
 
 
-def print_progress(curr, total, max_msg_length=80):
+def end_progress(key):
+    with _progress_lock:
+        _progress.pop(key, None)
+
+
+def print_progress(curr, total, max_msg_length=80, suffix=""):
     # [12345678901234567890]
     # [████████------------]
     # [━╸                  ]
@@ -890,6 +1105,7 @@ def print_progress(curr, total, max_msg_length=80):
         # also changes, thus producing the scrolling effect.
         msg = f'\r{Fore.YELLOW}[{anim[animBarLen + 3 - pos:]:.{animBarLen}}]{Style.RESET_ALL} {size_in_str(curr)}'
 
+    msg = msg + suffix
     curr_msg_length = len(msg)
     print_and_log(None, msg.ljust(max_msg_length, " "), newline=False)
 
@@ -1412,6 +1628,9 @@ def get_start_and_end_number(start_only=False, total_number_of_page=None):
 def wait(result=None, config=None):
     if result == PixivConstant.PIXIVUTIL_SKIP_DUPLICATE_NO_WAIT:
         return
+    # the requests are already paced by PixivRateLimiter
+    if config is not None and config.useRateLimiter:
+        return
     # Issue#276: add random delay for each post.
     if config is not None and config.downloadDelay > 0:
         delay = random.random() * config.downloadDelay
@@ -8,6 +8,7 @@ import shutil
 import time
 import traceback
 import pathlib
+from concurrent.futures import Future
 from urllib.error import URLError
 
 from colorama import Fore, Style
@@ -15,10 +16,11 @@ from colorama import Fore, Style
 import datetime_z
 import PixivBrowserFactory
 import PixivConstant
+import PixivDownloadEngine
 import PixivDownloadHandler
 import PixivHelper
 from PixivDBManager import PixivDBManager
-from PixivException import PixivException
+from PixivException import PixivCircuitOpenException, PixivException
 
 __re_manga_page = re.compile(r'(\d+(_big)?_p\d+)')
 
@@ -70,17 +72,14 @@ def process_image(caller,
 
         # check if already downloaded. images won't be downloaded twice - needed in process_image to catch any download
         r = db.selectImageByImageId(image_id, cols='save_name')
-        exists = False
-        in_db = False
-        if r is not None:
-            exists = db.cleanupFileExists(r[0])
-            in_db = True
+        in_db = r is not None
 
         # skip if already recorded in db and alwaysCheckFileSize is disabled and overwrite is disabled.
         if in_db and not config.alwaysCheckFileSize and not config.overwrite and not reencoding:
             PixivHelper.print_and_log(None, f'Already downloaded in DB: {image_id}')
             gc.collect()
             return PixivConstant.PIXIVUTIL_SKIP_DUPLICATE_NO_WAIT
+        exists = in_db and db.cleanupFileExists(r[0])
 
         # get the medium page
         try:
@@ -97,6 +96,9 @@ def process_image(caller,
                 assert (image.artist is not None)
                 caller.set_console_title(f"MemberId: {image.artist.artistId} ImageId: {image.imageId}")
 
+        except PixivCircuitOpenException:
+            # let the caller park the post
+            raise
         except PixivException as ex:
             caller.ERROR_CODE = ex.errorCode
             caller.__errorList.append(dict(type="Image", id=str(image_id), message=ex.message, exception=ex))
@@ -250,121 +252,133 @@ def process_image(caller,
 
             current_img = 1
             total = len(source_urls)
-            for img in source_urls:
-                prefix = f"{Fore.CYAN}[{current_img}/{total}]{Style.RESET_ALL} "
-                PixivHelper.print_and_log(None, f'{prefix}Image URL : {img}')
-                url = os.path.basename(img)
-                # split_url = url.split('.')
-                # if split_url[0].startswith(str(image_id)):
-                filename_format = config.filenameFormat
-                if image.imageMode == 'manga':
-                    filename_format = config.filenameMangaFormat
-
-                filename = PixivHelper.make_filename(filename_format,
-                                                        image,
-                                                        tagsSeparator=config.tagsSeparator,
-                                                        tagsLimit=config.tagsLimit,
-                                                        fileUrl=url,
-                                                        bookmark=bookmark,
-                                                        searchTags=search_tags,
-                                                        useTranslatedTag=config.useTranslatedTag,
-                                                        tagTranslationLocale=config.tagTranslationLocale)
-                filename = PixivHelper.sanitize_filename(filename, target_dir)
-
-                if image.imageMode == 'manga' and config.createMangaDir:
-                    manga_page = __re_manga_page.findall(filename)
-                    if len(manga_page) > 0:
-                        splitted_filename = filename.split(manga_page[0][0], 1)
-                        splitted_manga_page = manga_page[0][0].split("_p", 1)
-                        # filename = splitted_filename[0] + splitted_manga_page[0] + os.sep + "_p" + splitted_manga_page[1] + splitted_filename[1]
-                        filename = f"{splitted_filename[0]}{splitted_manga_page[0]}{os.sep}_p{splitted_manga_page[1]}{splitted_filename[1]}"
-
-                PixivHelper.print_and_log('info', f'{prefix}Filename  : {filename}')
-
-                result = PixivConstant.PIXIVUTIL_NOT_OK
-                try:
-                    (result, filename) = PixivDownloadHandler.download_image(caller,
-                                                                                img,
-                                                                                filename,
-                                                                                referer,
-                                                                                config.overwrite,
-                                                                                config.retry,
-                                                                                config.backupOldFile,
-                                                                                image,
-                                                                                page,
-                                                                                notifier)
-
-                    if result == PixivConstant.PIXIVUTIL_NOT_OK:
-                        PixivHelper.print_and_log('error', f'Image url not found/failed to download: {image.imageId}')
-                    elif result == PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT:
-                        raise KeyboardInterrupt()
 
-                    manga_files.append((image_id, page, filename))
+            # download the pages concurrently using the download engine, the results are collected back in page order
+            engine = PixivDownloadEngine.get_engine(config) if total > 1 else None
+            page_downloads = list()
+            try:
+                for img in source_urls:
+                    prefix = f"{Fore.CYAN}[{current_img}/{total}]{Style.RESET_ALL} "
+                    PixivHelper.print_and_log(None, f'{prefix}Image URL : {img}')
+                    url = os.path.basename(img)
+                    # split_url = url.split('.')
+                    # if split_url[0].startswith(str(image_id)):
+                    filename_format = config.filenameFormat
+                    if image.imageMode == 'manga':
+                        filename_format = config.filenameMangaFormat
+
+                    filename = PixivHelper.make_filename(filename_format,
+                                                            image,
+                                                            tagsSeparator=config.tagsSeparator,
+                                                            tagsLimit=config.tagsLimit,
+                                                            fileUrl=url,
+                                                            bookmark=bookmark,
+                                                            searchTags=search_tags,
+                                                            useTranslatedTag=config.useTranslatedTag,
+                                                            tagTranslationLocale=config.tagTranslationLocale)
+                    filename = PixivHelper.sanitize_filename(filename, target_dir)
+
+                    if image.imageMode == 'manga' and config.createMangaDir:
+                        manga_page = __re_manga_page.findall(filename)
+                        if len(manga_page) > 0:
+                            splitted_filename = filename.split(manga_page[0][0], 1)
+                            splitted_manga_page = manga_page[0][0].split("_p", 1)
+                            # filename = splitted_filename[0] + splitted_manga_page[0] + os.sep + "_p" + splitted_manga_page[1] + splitted_filename[1]
+                            filename = f"{splitted_filename[0]}{splitted_manga_page[0]}{os.sep}_p{splitted_manga_page[1]}{splitted_filename[1]}"
+
+                    PixivHelper.print_and_log('info', f'{prefix}Filename  : {filename}')
+
+                    job = PixivDownloadEngine.DownloadJob(img, filename, referer, image=image, page=page)
+                    if engine is not None:
+                        page_downloads.append((job, engine.submit(caller, job, notifier)))
+                    else:
+                        page_result = __download_page(caller, job, notifier)
+                        page_downloads.append((job, page_result))
+                        if page_result is not None and page_result[0] == PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT:
+                            raise KeyboardInterrupt()
+                        PixivHelper.print_and_log(None, '')
                     page = page + 1
 
-                except URLError:
-                    PixivHelper.print_and_log('error', f'Error when download_image(), giving up url: {img}')
-                PixivHelper.print_and_log(None, '')
-
-                # XMP image info per images
-                if config.writeImageXMPPerImage:
-                    filename_info_format = config.filenameInfoFormat or config.filenameFormat
-                    # Issue #575
-                    if image.imageMode == 'manga':
-                        filename_info_format = config.filenameMangaInfoFormat or config.filenameMangaFormat or filename_info_format
-                    # If we are creating an ugoira, we need to create side-car metadata for each converted file.
-                    if image.imageMode == 'ugoira_view':
-                        def get_info_filename(extension):
-                            fileUrl = os.path.splitext(url)[0] + "." + extension
+                    # XMP image info per images
+                    if config.writeImageXMPPerImage:
+                        filename_info_format = config.filenameInfoFormat or config.filenameFormat
+                        # Issue #575
+                        if image.imageMode == 'manga':
+                            filename_info_format = config.filenameMangaInfoFormat or config.filenameMangaFormat or filename_info_format
+                        # If we are creating an ugoira, we need to create side-car metadata for each converted file.
+                        if image.imageMode == 'ugoira_view':
+                            def get_info_filename(extension):
+                                fileUrl = os.path.splitext(url)[0] + "." + extension
+                                info_filename = PixivHelper.make_filename(filename_info_format,
+                                                image,
+                                                tagsSeparator=config.tagsSeparator,
+                                                tagsLimit=config.tagsLimit,
+                                                fileUrl=fileUrl,
+                                                appendExtension=False,
+                                                bookmark=bookmark,
+                                                searchTags=search_tags,
+                                                useTranslatedTag=config.useTranslatedTag,
+                                                tagTranslationLocale=config.tagTranslationLocale)
+                                return PixivHelper.sanitize_filename(info_filename + ".xmp", target_dir)
+                            if config.createGif:
+                                info_filename = get_info_filename("gif")
+                                image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
+                            if config.createApng:
+                                info_filename = get_info_filename("apng")
+                                image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
+                            if config.createAvif:
+                                info_filename = get_info_filename("avif")
+                                image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
+                            if config.createWebm:
+                                info_filename = get_info_filename("webm")
+                                image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
+                            if config.createWebp:
+                                info_filename = get_info_filename("webp")
+                                image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
+                            if config.createMkv:
+                                info_filename = get_info_filename("mkv")
+                                image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
+                            if not config.deleteZipFile:
+                                info_filename = get_info_filename("zip")
+                                image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
+                            if not config.deleteUgoira:
+                                info_filename = get_info_filename("ugoira")
+                                image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
+                        else:
                             info_filename = PixivHelper.make_filename(filename_info_format,
-                                            image,
-                                            tagsSeparator=config.tagsSeparator,
-                                            tagsLimit=config.tagsLimit,
-                                            fileUrl=fileUrl,
-                                            appendExtension=False,
-                                            bookmark=bookmark,
-                                            searchTags=search_tags,
-                                            useTranslatedTag=config.useTranslatedTag,
-                                            tagTranslationLocale=config.tagTranslationLocale)
-                            return PixivHelper.sanitize_filename(info_filename + ".xmp", target_dir)
-                        if config.createGif:
-                            info_filename = get_info_filename("gif")
-                            image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
-                        if config.createApng:
-                            info_filename = get_info_filename("apng")
-                            image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
-                        if config.createAvif:
-                            info_filename = get_info_filename("avif")
-                            image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
-                        if config.createWebm:
-                            info_filename = get_info_filename("webm")
+                                                                        image,
+                                                                        tagsSeparator=config.tagsSeparator,
+                                                                        tagsLimit=config.tagsLimit,
+                                                                        fileUrl=url,
+                                                                        appendExtension=False,
+                                                                        bookmark=bookmark,
+                                                                        searchTags=search_tags,
+                                                                        useTranslatedTag=config.useTranslatedTag,
+                                                                        tagTranslationLocale=config.tagTranslationLocale)
+                            info_filename = PixivHelper.sanitize_filename(info_filename + ".xmp", target_dir)
                             image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
-                        if config.createWebp:
-                            info_filename = get_info_filename("webp")
-                            image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
-                        if config.createMkv:
-                            info_filename = get_info_filename("mkv")
-                            image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
-                        if not config.deleteZipFile:
-                            info_filename = get_info_filename("zip")
-                            image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
-                        if not config.deleteUgoira:
-                            info_filename = get_info_filename("ugoira")
-                            image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
-                    else:
-                        info_filename = PixivHelper.make_filename(filename_info_format,
-                                                                    image,
-                                                                    tagsSeparator=config.tagsSeparator,
-                                                                    tagsLimit=config.tagsLimit,
-                                                                    fileUrl=url,
-                                                                    appendExtension=False,
-                                                                    bookmark=bookmark,
-                                                                    searchTags=search_tags,
-                                                                    useTranslatedTag=config.useTranslatedTag,
-                                                                    tagTranslationLocale=config.tagTranslationLocale)
-                        info_filename = PixivHelper.sanitize_filename(info_filename + ".xmp", target_dir)
-                        image.WriteXMP(info_filename, config.useTranslatedTag, config.tagTranslationLocale)
-                current_img = current_img + 1
+                    current_img = current_img + 1
+
+                # collect the results, the post is only complete if all pages are downloaded
+                for (job, page_result) in page_downloads:
+                    if isinstance(page_result, Future):
+                        page_result = __download_page(caller, job, notifier, page_result)
+                    if page_result is None:
+                        result = PixivConstant.PIXIVUTIL_NOT_OK
+                        continue
+                    (page_result_code, filename) = page_result
+                    if page_result_code == PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT:
+                        raise KeyboardInterrupt()
+                    manga_files.append((image_id, job.page, filename))
+                    if page_result_code == PixivConstant.PIXIVUTIL_NOT_OK:
+                        result = PixivConstant.PIXIVUTIL_NOT_OK
+                    elif result != PixivConstant.PIXIVUTIL_NOT_OK:
+                        result = page_result_code
+            finally:
+                # stop the pending pages if aborted
+                for (_, page_result) in page_downloads:
+                    if isinstance(page_result, Future):
+                        page_result.cancel()
 
             if config.writeImageInfo or config.writeImageJSON or config.writeImageXMP:
                 filename_info_format = config.filenameInfoFormat or config.filenameFormat
@@ -479,6 +493,50 @@ def process_image(caller,
         raise
 
 
+def get_downloaded_image_ids(caller, config, image_ids):
+    '''return the ids (as int) of the listed posts which process_image() will skip as already downloaded.
+
+       Checked with one query for the whole listing, so the callers can skip them before any per-image work.
+       Empty if alwaysCheckFileSize or overwrite is enabled, as the files need to be checked.
+    '''
+    if config.alwaysCheckFileSize or config.overwrite or len(image_ids) == 0:
+        return set()
+    db: PixivDBManager = caller.__dbManager__
+    return db.selectDownloadedImageIds(image_ids)
+
+
+def prefetch_image_pages(caller, config, image_ids, downloaded=None):
+    '''prefetch the info of the next posts while the current post is downloading, see prefetchCount'''
+    if config.prefetchCount <= 0:
+        return
+    if downloaded is None:
+        downloaded = get_downloaded_image_ids(caller, config, image_ids)
+    prefetch_ids = list()
+    for image_id in image_ids:
+        if len(prefetch_ids) >= config.prefetchCount:
+            break
+        # same as process_image(), no need to fetch the posts which will be skipped
+        if int(image_id) in downloaded:
+            continue
+        prefetch_ids.append(image_id)
+    PixivBrowserFactory.getBrowser().prefetchImagePages(prefetch_ids)
+
+
+def __download_page(caller, job, notifier, future=None):
+    '''download the page or wait for the download engine, return (result, filename) or None if the url is given up'''
+    try:
+        if future is not None:
+            (result, filename) = future.result()
+        else:
+            (result, filename) = PixivDownloadEngine.download(caller, job, notifier)
+        if result == PixivConstant.PIXIVUTIL_NOT_OK:
+            PixivHelper.print_and_log('error', f'Image url not found/failed to download: {job.image.imageId}')
+        return (result, filename)
+    except URLError:
+        PixivHelper.print_and_log('error', f'Error when download_image(), giving up url: {job.url}')
+        return None
+
+
 def process_manga_series(caller,
                          config,
                          manga_series_id: int,
@@ -1,19 +1,25 @@
 import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import PixivArtistHandler
+import PixivBrowserFactory
+import PixivConstant
 import PixivHelper
+import PixivRunJournal
 import PixivSketchHandler
 import PixivTagsHandler
+from PixivException import PixivCircuitOpenException, PixivException
 from PixivListItem import PixivListItem
 from PixivTags import PixivTags
 
 
-def process_list(caller, config, list_file_name=None, tags=None, include_sketch=False):
+def process_list(caller, config, list_file_name=None, tags=None, include_sketch=False, run_id=None, parallel_members=1):
     db = caller.__dbManager__
-    br = caller.__br__
 
     result = None
+    journal = PixivRunJournal.start(db, "list", run_id)
     try:
         # Getting the list
         if config.processFromDb:
@@ -38,55 +44,11 @@ def process_list(caller, config, list_file_name=None, tags=None, include_sketch=
                         break
 
         PixivHelper.print_and_log('info', f"Found {len(result)} items.")
-        current_member = 1
-        for item in result:
-            retry_count = 0
-            while True:
-                try:
-                    prefix = f"[{current_member} of {len(result)}] "
-                    PixivArtistHandler.process_member(caller,
-                                                      config,
-                                                      item.memberId,
-                                                      user_dir=item.path,
-                                                      tags=tags,
-                                                      title_prefix=prefix)
-                    break
-                except KeyboardInterrupt:
-                    raise
-                except BaseException as ex:
-                    if retry_count > config.retry:
-                        PixivHelper.print_and_log('error', f'Giving up member_id: {item.memberId} ==> {ex}')
-                        break
-                    retry_count = retry_count + 1
-                    print(f'Something wrong, retrying after 2 second ({retry_count}) ==> {ex}')
-                    PixivHelper.print_delay(2)
-
-            retry_count = 0
-            while include_sketch:
-                try:
-                    # Issue 1007
-                    # fetching artist token...
-                    (artist_model, _) = br.getMemberPage(item.memberId)
-                    prefix = f"[{current_member} ({item.memberId} - {artist_model.artistToken}) of {len(result)}] "
-                    PixivSketchHandler.process_sketch_artists(caller,
-                                                              config,
-                                                              artist_model.artistToken,
-                                                              title_prefix=prefix)
-                    break
-                except KeyboardInterrupt:
-                    raise
-                except BaseException as ex:
-                    if retry_count > config.retry:
-                        PixivHelper.print_and_log('error', f'Giving up member_id: {item.memberId} when processing PixivSketch ==> {ex}')
-                        break
-                    retry_count = retry_count + 1
-                    print(f'Something wrong, retrying after 2 second ({retry_count}) ==> {ex}')
-                    PixivHelper.print_delay(2)
-
-            current_member = current_member + 1
-            br.clear_history()
-            print(f'done for member id = {item.memberId}.')
-            print('')
+        if parallel_members > 1:
+            process_list_parallel(caller, config, result, tags, include_sketch, journal, parallel_members)
+        else:
+            for (current_member, item) in enumerate(result, start=1):
+                process_list_item(caller, config, item, current_member, len(result), tags, include_sketch, journal)
     except Exception as ex:
         if isinstance(ex, KeyboardInterrupt):
             raise
@@ -94,6 +56,129 @@ def process_list(caller, config, list_file_name=None, tags=None, include_sketch=
         PixivHelper.print_and_log('error', f'Error at process_list(): {sys.exc_info()}')
         print('Failed')
         raise
+    finally:
+        PixivRunJournal.stop()
+
+
+def process_list_parallel(caller, config, items, tags, include_sketch, journal, parallel_members):
+    '''process the members using parallel_members worker threads.
+
+       Each worker uses its own browser and db connection, the rate limiter is shared.
+       The console output is prefixed with the member id.
+       throw PixivException if useRateLimiter is disabled, as each worker would only wait for its own downloadDelay.
+    '''
+    if not config.useRateLimiter:
+        raise PixivException("--parallel-members requires useRateLimiter = True, so the workers share the same rate limit.",
+                              errorCode=PixivException.OTHER_ERROR)
+    PixivHelper.print_and_log('info', f"Processing {parallel_members} members at the same time.")
+    output = PixivHelper.WorkerOutput(sys.stdout)
+    stop = threading.Event()
+
+    def worker(current_member, item):
+        if stop.is_set():
+            return
+        output.set_prefix(f"[{item.memberId}] ")
+        try:
+            process_list_item(caller, config, item, current_member, len(items), tags, include_sketch, journal)
+        finally:
+            output.set_prefix(None)
+
+    def init_worker():
+        PixivBrowserFactory.getWorkerBrowser()
+
+    futures = list()
+    sys.stdout = output
+    executor = ThreadPoolExecutor(max_workers=parallel_members, thread_name_prefix="member", initializer=init_worker)
+    try:
+        for (current_member, item) in enumerate(items, start=1):
+            futures.append(executor.submit(worker, current_member, item))
+        for future in as_completed(futures):
+            future.result()
+    except BaseException:
+        # stop the queued members on any error, not only on Ctrl+C
+        stop.set()
+        for future in futures:
+            future.cancel()
+        PixivHelper.print_and_log('warn', 'Waiting for the running members to finish...')
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        sys.stdout = output.stream
+
+
+def process_list_item(caller, config, item, current_member, total, tags=None, include_sketch=False, journal=None):
+    if journal is not None and journal.is_done(PixivRunJournal.ITEM_MEMBER, item.memberId):
+        print(f'[{current_member} of {total}] Member id = {item.memberId} already completed in run id: {journal.run_id}')
+        return
+
+    br = PixivBrowserFactory.getBrowser()
+    completed = False
+    parked = False
+    retry_count = 0
+    while True:
+        try:
+            prefix = f"[{current_member} of {total}] "
+            result = PixivArtistHandler.process_member(caller,
+                                                       config,
+                                                       item.memberId,
+                                                       user_dir=item.path,
+                                                       tags=tags,
+                                                       title_prefix=prefix)
+            # some posts failed, retry the member on --resume
+            completed = result == PixivConstant.PIXIVUTIL_OK
+            break
+        except KeyboardInterrupt:
+            raise
+        except PixivCircuitOpenException as ex:
+            park_member(caller, item.memberId, ex)
+            parked = True
+            break
+        except BaseException as ex:
+            if retry_count > config.retry:
+                PixivHelper.print_and_log('error', f'Giving up member_id: {item.memberId} ==> {ex}')
+                break
+            retry_count = retry_count + 1
+            print(f'Something wrong, retrying after 2 second ({retry_count}) ==> {ex}')
+            PixivHelper.print_delay(2)
+
+    retry_count = 0
+    while include_sketch and not parked:
+        try:
+            # Issue 1007
+            # fetching artist token...
+            (artist_model, _) = br.getMemberPage(item.memberId)
+            prefix = f"[{current_member} ({item.memberId} - {artist_model.artistToken}) of {total}] "
+            PixivSketchHandler.process_sketch_artists(caller,
+                                                      config,
+                                                      artist_model.artistToken,
+                                                      title_prefix=prefix)
+            break
+        except KeyboardInterrupt:
+            raise
+        except PixivCircuitOpenException as ex:
+            park_member(caller, item.memberId, ex)
+            completed = False
+            break
+        except BaseException as ex:
+            if retry_count > config.retry:
+                PixivHelper.print_and_log('error', f'Giving up member_id: {item.memberId} when processing PixivSketch ==> {ex}')
+                completed = False
+                break
+            retry_count = retry_count + 1
+            print(f'Something wrong, retrying after 2 second ({retry_count}) ==> {ex}')
+            PixivHelper.print_delay(2)
+
+    if completed and journal is not None:
+        journal.mark_done(PixivRunJournal.ITEM_MEMBER, item.memberId)
+    br.clear_history()
+    print(f'done for member id = {item.memberId}.')
+    print('')
+
+
+def park_member(caller, member_id, ex):
+    '''the server is not responding, skip the member without marking it as done so it can be resumed later'''
+    PixivHelper.print_and_log('warn', f'Skipping member_id: {member_id} for now ==> {ex.message}')
+    caller.__errorList.append(dict(type="Member", id=str(member_id), message=ex.message, exception=ex))
 
 
 def process_tags_list(caller,
@@ -7,6 +7,8 @@ import os
 import random
 import ssl
 import sys
+import threading
+import time
 from collections import OrderedDict
 from datetime import datetime
 from typing import Dict
@@ -16,6 +18,12 @@ import requests
 
 import PixivHelper
 import PixivOAuthBrowser
+import PixivRateLimiter
+import PixivRetryPolicy
+from PixivException import PixivCircuitOpenException
+
+# refresh the access token this many seconds before it is expired
+ACCESS_TOKEN_EXPIRY_MARGIN = 60
 
 
 # monkey patch cloudscraper.User_Agent.loadUserAgent function
@@ -121,6 +129,7 @@ class PixivOAuth():
     _password: str = None
     _refresh_token: str = None
     _access_token: str = None
+    _access_token_expiry: float = 0
     _url: str = "https://oauth.secure.pixiv.net/auth/token"
     _proxies: Dict[str, str] = None
     _tzInfo: PixivHelper.LocalUTCOffsetTimezone = None
@@ -136,7 +145,7 @@ class PixivOAuth():
         cloudscraper.create_scraper = create_scraper
     _req = cloudscraper.create_scraper(sess=sess)
 
-    def __init__(self, username, password, proxies=None, validate_ssl=True, refresh_token=None):
+    def __init__(self, username, password, proxies=None, validate_ssl=True, refresh_token=None, config=None):
         if username is None or len(username) <= 0:
             raise Exception("Username cannot empty!")
         if password is None or len(password) <= 0:
@@ -150,8 +159,12 @@ class PixivOAuth():
         else:
             self._refresh_token = None
         self._access_token = None
+        self._access_token_expiry = 0
+        self._token_lock = threading.Lock()
         self._tzInfo = PixivHelper.LocalUTCOffsetTimezone()
         self._validate_ssl = validate_ssl
+        # the requests are sent using the retry policy, rate limiter and circuit breaker from the config
+        self._config = config
         PixivOAuthBrowser.set_proxy(proxies)
         PixivOAuthBrowser.set_verify(validate_ssl)
 
@@ -189,21 +202,84 @@ class PixivOAuth():
                 'X-Client-Time': time,
                 'X-Client-Hash': time_hash.hexdigest()}
 
-    def _get_headers_with_bearer(self):
-        if self._access_token is None:
-            self.login()
+    def _get_headers_with_bearer(self, access_token=None):
+        if access_token is None:
+            access_token = self.get_access_token()
 
         headers = self._get_default_headers()
-        headers["Authorization"] = "Bearer {0}".format(self._access_token)
+        headers["Authorization"] = "Bearer {0}".format(access_token)
         return headers
 
+    def get_access_token(self, rejected_token=None):
+        ''' return the cached access token, login again only if it is about to expire or it is rejected by the server.
+
+            rejected_token is the token which got the error, it is not refreshed again if other thread already did it.
+        '''
+        with self._token_lock:
+            if self._access_token is None \
+               or time.monotonic() > self._access_token_expiry - ACCESS_TOKEN_EXPIRY_MARGIN \
+               or (rejected_token is not None and rejected_token == self._access_token):
+                self.login()
+            return self._access_token
+
+    @staticmethod
+    def _is_token_rejected(response):
+        # app-api return 400 with OAuth error message if the access token is expired
+        return response.status_code == 401 or (response.status_code == 400 and "invalid_grant" in response.text)
+
+    def _send(self, method, url, get_headers, **kwargs):
+        ''' send the request, the network errors and temporary server errors are retried using the retry policy.
+
+            The requests go through the circuit breaker, the concurrency limit and the rate limiter as in
+            PixivBrowser.open_with_retry(), using the api host class.
+            get_headers is called for each attempt, as the headers contain the client time.
+        '''
+        retry_state = None
+        if self._config is not None:
+            retry_state = PixivRetryPolicy.get_policy(self._config).begin(self._config.retry)
+        limiter = PixivRateLimiter.get_limiter(self._config)
+        breaker = PixivRetryPolicy.get_breaker(self._config)
+        while True:
+            try:
+                breaker.before_request(url)
+                if limiter is not None:
+                    limiter.acquire(url)
+                with PixivRateLimiter.slot(self._config, url):
+                    response = method(url,
+                                      headers=get_headers(),
+                                      proxies=self._proxies,
+                                      verify=self._validate_ssl,
+                                      **kwargs)
+            except (KeyboardInterrupt, PixivCircuitOpenException):
+                raise
+            except BaseException as ex:
+                if PixivRetryPolicy.is_server_failure(ex):
+                    breaker.on_failure(url)
+                delay = retry_state.get_delay(ex) if retry_state is not None else None
+                if delay is None:
+                    raise
+                retry_state.wait(delay, ex)
+                continue
+
+            if response.status_code == 408 or response.status_code >= 500:
+                breaker.on_failure(url)
+            else:
+                breaker.on_success(url)
+            retry_after = response.headers.get('Retry-After')
+            if limiter is not None:
+                # the limiter will also slow down the other requests to the same host class
+                limiter.on_response(url, response.status_code, retry_after)
+            delay = retry_state.get_status_delay(response.status_code, retry_after) if retry_state is not None else None
+            if delay is None:
+                return response
+            retry_state.wait(delay, f"OAuth error code: {response.status_code}")
+
     def login_with_username_and_password(self):
         PixivHelper.get_logger().info("Login to OAuth using username and password.")
-        oauth_response = self._req.post(self._url,
-                                        data=self._get_values_for_login(),
-                                        headers=self._get_default_headers(),
-                                        proxies=self._proxies,
-                                        verify=self._validate_ssl)
+        oauth_response = self._send(self._req.post,
+                                    self._url,
+                                    self._get_default_headers,
+                                    data=self._get_values_for_login())
         return oauth_response
 
     def login(self):
@@ -211,11 +287,10 @@ class PixivOAuth():
         need_relogin = True
         if self._refresh_token is not None:
             PixivHelper.get_logger().info("Login to OAuth using refresh token.")
-            oauth_response = self._req.post(self._url,
-                                            data=self._get_values_for_refresh(),
-                                            headers=self._get_default_headers(),
-                                            proxies=self._proxies,
-                                            verify=self._validate_ssl)
+            oauth_response = self._send(self._req.post,
+                                        self._url,
+                                        self._get_default_headers,
+                                        data=self._get_values_for_refresh())
             if oauth_response.status_code == 200:
                 need_relogin = False
             else:
@@ -230,6 +305,7 @@ class PixivOAuth():
             info = json.loads(oauth_response.text)
             self._refresh_token = info["response"]["refresh_token"]
             self._access_token = info["response"]["access_token"]
+            self._access_token_expiry = time.monotonic() + info["response"].get("expires_in", 3600)
         elif oauth_response.status_code in (400, 403):
             info = oauth_response.text
             try:
@@ -245,10 +321,12 @@ class PixivOAuth():
 
     def get_user_info(self, userid):
         url = 'https://app-api.pixiv.net/v1/user/detail?user_id={0}'.format(userid)
-        user_info = self._req.get(url,
-                                  headers=self._get_headers_with_bearer(),
-                                  proxies=self._proxies,
-                                  verify=self._validate_ssl)
+        access_token = self.get_access_token()
+        user_info = self._send(self._req.get, url, lambda: self._get_headers_with_bearer(access_token))
+        if self._is_token_rejected(user_info):
+            PixivHelper.get_logger().info("OAuth access token is rejected, refreshing.")
+            access_token = self.get_access_token(rejected_token=access_token)
+            user_info = self._send(self._req.get, url, lambda: self._get_headers_with_bearer(access_token))
 
         if user_info.status_code == 404:
             PixivHelper.print_and_log('error', user_info.text)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=W0603
+import atexit
+import queue
+import shlex
+import subprocess
+import threading
+import time
+
+import PixivHelper
+
+_processor = None
+_processor_lock = threading.Lock()
+
+
+class PixivPostProcessor(object):
+    '''Run the postProcessingCmd with a fixed number of workers.
+
+       The queue is bounded, so the downloader will wait when the commands cannot keep up.
+    '''
+    _config = None
+    _queue = None
+    _workers = None
+    _results = None
+    _results_lock = None
+
+    def __init__(self, config):
+        self._config = config
+        self._queue = queue.Queue(maxsize=config.postProcessingQueueSize)
+        # list of (cmd, exit code, duration in seconds)
+        self._results = list()
+        self._results_lock = threading.Lock()
+        self._workers = list()
+        for i in range(config.postProcessingWorkers):
+            worker = threading.Thread(target=self._run, name=f"post-processing-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _run(self):
+        while True:
+            cmd = self._queue.get()
+            try:
+                if cmd is None:
+                    return
+                start = time.monotonic()
+                try:
+                    exit_code = subprocess.run(shlex.split(cmd), startupinfo=None).returncode
+                except OSError as ex:
+                    PixivHelper.print_and_log('error', f'Failed to run post processing command: {cmd} ==> {ex}')
+                    exit_code = None
+                duration = time.monotonic() - start
+                if exit_code is not None and exit_code != 0:
+                    PixivHelper.print_and_log('warn', f'Post processing command returned exit code = {exit_code}: {cmd}')
+                with self._results_lock:
+                    self._results.append((cmd, exit_code, duration))
+            finally:
+                self._queue.task_done()
+
+    def submit(self, cmd):
+        '''queue the command, block if the queue is full'''
+        try:
+            self._queue.put_nowait(cmd)
+        except queue.Full:
+            start = time.monotonic()
+            self._queue.put(cmd)
+            PixivHelper.get_logger().info("Waited %.3fs for post processing queue (%d commands).", time.monotonic() - start, self._queue.maxsize)
+
+    def shutdown(self):
+        '''wait for all queued commands to finish'''
+        if self._queue.qsize() > 0:
+            PixivHelper.print_and_log('info', f'Waiting for {self._queue.qsize()} post processing command(s) to finish...')
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def get_results(self):
+        with self._results_lock:
+            return list(self._results)
+
+    def print_summary(self):
+        results = self.get_results()
+        if len(results) == 0:
+            return
+        durations = [r[2] for r in results]
+        failed = [r for r in results if r[1] != 0]
+        PixivHelper.print_and_log('info', f'Post processing: {len(results)} command(s), {len(failed)} failed, ' +
+                                  f'total {sum(durations):.2f}s, average {sum(durations) / len(durations):.2f}s, max {max(durations):.2f}s')
+        for (cmd, exit_code, duration) in failed:
+            PixivHelper.print_and_log('warn', f' - exit code = {exit_code} ({duration:.2f}s): {cmd}')
+
+
+def get_processor(config):
+    '''return the shared post processor, the queued commands are drained at exit'''
+    global _processor
+    with _processor_lock:
+        if _processor is None:
+            _processor = PixivPostProcessor(config)
+            atexit.register(shutdown)
+    return _processor
+
+
+def shutdown():
+    '''drain the queue and print the summary'''
+    global _processor
+    with _processor_lock:
+        if _processor is not None:
+            _processor.shutdown()
+            _processor.print_summary()
+            _processor = None
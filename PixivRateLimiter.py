@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=W0603
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import PixivHelper
+
+# order matters, first match wins
+HOST_CLASSES = [
+    ("fanbox_download", re.compile(r"^downloads\.fanbox\.cc$")),
+    ("fanbox", re.compile(r"(^|\.)fanbox\.cc$")),
+    ("api", re.compile(r"^(app-api|oauth\.secure)\.pixiv\.net$")),
+    ("sketch", re.compile(r"^sketch\.pixiv\.net$")),
+    ("image", re.compile(r"(^|\.)pximg\.net$")),
+    ("pixiv", re.compile(r"(^|\.)pixiv\.net$")),
+]
+DEFAULT_HOST_CLASS = "other"
+
+# status code which means the server want us to slow down
+THROTTLE_CODES = (429, 503)
+
+_limiter = None
+_limiter_lock = threading.Lock()
+_concurrency = None
+
+
+def get_host_class(url) -> str:
+    if hasattr(url, "get_full_url"):
+        url = url.get_full_url()
+    host = urlparse(url).hostname or ""
+    for (host_class, pattern) in HOST_CLASSES:
+        if pattern.search(host):
+            return host_class
+    return DEFAULT_HOST_CLASS
+
+
+def parse_rate_limits(value: str) -> dict:
+    ''' parse "pixiv=1,image=10" into {"pixiv": 1.0, "image": 10.0}'''
+    result = dict()
+    for item in value.split(","):
+        item = item.strip()
+        if len(item) == 0:
+            continue
+        (host_class, _, rate) = item.partition("=")
+        result[host_class.strip()] = float(rate)
+    return result
+
+
+def parse_retry_after(value) -> float:
+    ''' return the Retry-After header value in seconds, or None if not available.'''
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=timezone.utc)
+    return max((retry_date - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class TokenBucket(object):
+    ''' Token bucket with AIMD rate: halved when throttled, slowly recovered on success.'''
+
+    def __init__(self, rate, burst=1.0):
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.capacity = max(burst, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        ''' take a token if available and return 0, otherwise return the seconds to wait before retrying.'''
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self) -> float:
+        ''' block until a token is available, return the total waiting time.'''
+        waited = 0.0
+        while True:
+            delay = self.reserve()
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def on_success(self):
+        with self._lock:
+            # additive increase
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            # multiplicative decrease
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            now = time.monotonic()
+            self.updated = now
+            if retry_after is not None and retry_after > 0:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+class PixivRateLimiter(object):
+    ''' One token bucket per host class, see HOST_CLASSES.'''
+    _config = None
+    _buckets = None
+    # the rateLimits used to build the buckets, the config can be reloaded in place
+    rate_limits = None
+
+    def __init__(self, config):
+        self._config = config
+        self.rate_limits = config.rateLimits
+        self._buckets = dict()
+        rates = parse_rate_limits(config.rateLimits)
+        default_rate = rates.get(DEFAULT_HOST_CLASS, 1.0)
+        for host_class in [c[0] for c in HOST_CLASSES] + [DEFAULT_HOST_CLASS]:
+            rate = rates.get(host_class, default_rate)
+            self._buckets[host_class] = TokenBucket(rate, burst=max(rate, 1.0))
+
+    def get_bucket(self, url) -> TokenBucket:
+        return self._buckets[get_host_class(url)]
+
+    def acquire(self, url):
+        host_class = get_host_class(url)
+        waited = self._buckets[host_class].acquire()
+        if waited >= 1:
+            PixivHelper.print_and_log(None, f"Rate limited ({host_class}), waited for {waited:.3}s")
+        return waited
+
+    def on_response(self, url, code, retry_after=None):
+        bucket = self.get_bucket(url)
+        if code in THROTTLE_CODES:
+            retry_after = parse_retry_after(retry_after)
+            PixivHelper.print_and_log('warn', f"Server responded with {code}, slowing down {get_host_class(url)} requests to {bucket.rate / 2:.3}/s" +
+                                      (f", retry after {retry_after}s" if retry_after else ""))
+            bucket.on_throttle(retry_after)
+        elif code < 400:
+            bucket.on_success()
+
+
+class HostConcurrency(object):
+    ''' Limit the number of requests in progress at the same time for each host class, see HOST_CLASSES.'''
+    _config = None
+    _limits = None
+    _semaphores = None
+    # the concurrencyLimits used to build the semaphores, the config can be reloaded in place
+    concurrency_limits = None
+
+    def __init__(self, config):
+        self._config = config
+        self.concurrency_limits = config.concurrencyLimits
+        self._limits = dict()
+        self._semaphores = dict()
+        limits = parse_rate_limits(config.concurrencyLimits)
+        default_limit = limits.get(DEFAULT_HOST_CLASS, 1)
+        for host_class in [c[0] for c in HOST_CLASSES] + [DEFAULT_HOST_CLASS]:
+            limit = max(int(limits.get(host_class, default_limit)), 1)
+            self._limits[host_class] = limit
+            self._semaphores[host_class] = threading.BoundedSemaphore(limit)
+
+    def get_limit(self, url) -> int:
+        return self._limits[get_host_class(url)]
+
+    @contextmanager
+    def slot(self, url):
+        ''' block until the host class of the url has a free slot.'''
+        host_class = get_host_class(url)
+        semaphore = self._semaphores[host_class]
+        if not semaphore.acquire(blocking=False):
+            PixivHelper.get_logger().debug("Waiting for %s slot (%d in progress)", host_class, self._limits[host_class])
+            semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+def get_limiter(config):
+    ''' return the shared rate limiter, or None if useRateLimiter is disabled'''
+    global _limiter
+    if config is None or not config.useRateLimiter:
+        return None
+    with _limiter_lock:
+        # keep the state across the job configs, only rebuild if the limits are changed
+        if _limiter is None or _limiter.rate_limits != config.rateLimits:
+            _limiter = PixivRateLimiter(config)
+    return _limiter
+
+
+def get_concurrency(config):
+    ''' return the shared per host class concurrency limit'''
+    global _concurrency
+    with _limiter_lock:
+        # keep the semaphores shared across the job configs, only rebuild if the limits are changed
+        if _concurrency is None or _concurrency.concurrency_limits != config.concurrencyLimits:
+            _concurrency = HostConcurrency(config)
+    return _concurrency
+
+
+@contextmanager
+def slot(config, url):
+    ''' hold a concurrency slot for the url, no limit if config is not available.'''
+    if config is None:
+        yield
+        return
+    with get_concurrency(config).slot(url):
+        yield
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=W0603
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import PixivHelper
+
+_cache = None
+_cache_lock = threading.Lock()
+_disk_cache = None
+
+# urls stored in the disk cache, the time to live is set by diskCacheTTL
+DISK_CACHE_ENDPOINTS = (("profile", re.compile(r'^https://www\.pixiv\.net/ajax/user/\d+/profile/all')),
+                        ("user", re.compile(r'^https://www\.pixiv\.net/ajax/user/\d+(\?|$)')),
+                        ("illust", re.compile(r'^https://www\.pixiv\.net/ajax/illust/\d+(\?|$)')),
+                        ("get_work", re.compile(r'^https://www\.pixiv\.net/rpc/get_work\.php\?')))
+
+_re_number = re.compile(r'\d+')
+
+
+def get_endpoint(url):
+    '''group the urls by host and path, ignoring the ids and the query string'''
+    parsed = urlparse(url)
+    return f"{parsed.netloc}{_re_number.sub('{id}', parsed.path)}"
+
+
+def get_size(item):
+    '''approximate memory usage of the cached item in bytes.
+
+       The parsed json should be put with the size of the response instead, as it is serialized here to get the size.
+    '''
+    if isinstance(item, (bytes, bytearray)):
+        return len(item)
+    if isinstance(item, str):
+        return len(item.encode("utf-8", errors="ignore"))
+    if isinstance(item, (dict, list)):
+        return len(json.dumps(item, ensure_ascii=False))
+    return sys.getsizeof(item)
+
+
+class PixivResponseCache(object):
+    '''LRU cache of the page responses with expiry time.
+
+       Limited by the number of items and the total size in bytes,
+       the least recently used items are evicted first.
+    '''
+    _max_items = 0
+    _max_bytes = 0
+    _size = 0
+    _items = None
+    _lock = None
+    # endpoint => [hits, misses, evictions]
+    _stats = None
+
+    def __init__(self, max_items, max_bytes):
+        self._max_items = max_items
+        self._max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict()
+
+    def _count(self, key, hit=0, miss=0, eviction=0):
+        stat = self._stats.setdefault(get_endpoint(key), [0, 0, 0])
+        stat[0] += hit
+        stat[1] += miss
+        stat[2] += eviction
+
+    def get(self, key, sliding_window=3600):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                (item, expiry, size) = entry
+                if expiry - time.time() > 0:
+                    self._items[key] = (item, expiry + sliding_window, size)
+                    self._items.move_to_end(key)
+                    self._count(key, hit=1)
+                    return item
+
+                # expired data
+                del self._items[key]
+                self._size -= size
+            self._count(key, miss=1)
+        return None
+
+    def put(self, key, item, expiration=3600, size=None):
+        '''size is the length of the response in bytes, calculated from the item if not given'''
+        if size is None:
+            size = get_size(item)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= old[2]
+            self._items[key] = (item, time.time() + expiration, size)
+            self._size += size
+
+            while len(self._items) > self._max_items or self._size > self._max_bytes:
+                (old_key, old) = self._items.popitem(last=False)
+                self._size -= old[2]
+                self._count(old_key, eviction=1)
+
+    def get_stats(self):
+        with self._lock:
+            return {endpoint: tuple(stat) for (endpoint, stat) in self._stats.items()}
+
+    def print_stats(self):
+        stats = self.get_stats()
+        if len(stats) == 0:
+            return
+        hits = sum(stat[0] for stat in stats.values())
+        lookups = hits + sum(stat[1] for stat in stats.values())
+        PixivHelper.print_and_log('info', f'Response cache: {hits} hits of {lookups} lookups ({hits / lookups if lookups > 0 else 0:.1%}), ' +
+                                  f'{len(self._items)} items, {PixivHelper.size_in_str(self._size)} in memory.')
+        for (endpoint, (hit, miss, eviction)) in sorted(stats.items()):
+            PixivHelper.get_logger().info(" - %s: %d hits, %d misses, %d evictions", endpoint, hit, miss, eviction)
+
+
+def get_disk_cache_endpoint(url):
+    for (endpoint, pattern) in DISK_CACHE_ENDPOINTS:
+        if pattern.match(url):
+            return endpoint
+    return None
+
+
+def parse_disk_cache_ttl(value):
+    '''parse endpoint=seconds,endpoint=seconds'''
+    result = dict()
+    for item in value.split(","):
+        item = item.strip()
+        if len(item) == 0:
+            continue
+        (endpoint, ttl) = item.split("=", 1)
+        result[endpoint.strip()] = int(ttl)
+    return result
+
+
+class DiskCacheEntry(object):
+    body = None
+    etag = None
+    last_modified = None
+    fresh = False
+
+    def __init__(self, body, etag, last_modified, fresh):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fresh = fresh
+
+
+class PixivDiskCache(object):
+    '''Responses of the rarely changed endpoints stored in sqlite, kept between runs.
+
+       The expired responses are revalidated using ETag/Last-Modified if the server sent them.
+    '''
+    path = None
+    _conn = None
+    _lock = None
+    _ttl = None
+    # endpoint => [fresh hits, revalidated, misses]
+    _stats = None
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self._ttl = ttl if ttl is not None else dict()
+        self._lock = threading.Lock()
+        self._stats = dict()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS http_cache (
+                                url TEXT PRIMARY KEY,
+                                endpoint TEXT,
+                                body BLOB,
+                                etag TEXT,
+                                last_modified TEXT,
+                                created_date REAL,
+                                expiry REAL
+                              )''')
+        self._conn.commit()
+
+    def _count(self, endpoint, hit=0, revalidated=0, miss=0):
+        stat = self._stats.setdefault(endpoint, [0, 0, 0])
+        stat[0] += hit
+        stat[1] += revalidated
+        stat[2] += miss
+
+    def get(self, url, revalidate=False):
+        '''return the cached entry, or None if not cached or the endpoint is not cacheable
+
+           revalidate=True returns the entry as expired, so it is only used with If-None-Match/If-Modified-Since.
+        '''
+        endpoint = get_disk_cache_endpoint(url)
+        if endpoint is None:
+            return None
+        with self._lock:
+            row = self._conn.execute('''SELECT body, etag, last_modified, expiry FROM http_cache WHERE url = ?''', (url, )).fetchone()
+            if row is None:
+                self._count(endpoint, miss=1)
+                return None
+            fresh = not revalidate and row[3] > time.time()
+            if fresh:
+                self._count(endpoint, hit=1)
+            elif row[1] is None and row[2] is None:
+                # cannot be revalidated
+                self._count(endpoint, miss=1)
+                return None
+            return DiskCacheEntry(row[0], row[1], row[2], fresh)
+
+    def put(self, url, body, etag=None, last_modified=None):
+        endpoint = get_disk_cache_endpoint(url)
+        if endpoint is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute('''INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                               (url, endpoint, body, etag, last_modified, now, now + self._ttl.get(endpoint, 0)))
+            self._conn.commit()
+
+    def revalidated(self, url):
+        '''the server returned 304 Not Modified, keep the response for another ttl'''
+        endpoint = get_disk_cache_endpoint(url)
+        with self._lock:
+            self._conn.execute('''UPDATE http_cache SET expiry = ? WHERE url = ?''', (time.time() + self._ttl.get(endpoint, 0), url))
+            self._conn.commit()
+            self._count(endpoint, revalidated=1)
+
+    def purge(self):
+        with self._lock:
+            cursor = self._conn.execute('''DELETE FROM http_cache''')
+            self._conn.commit()
+            self._conn.execute('''VACUUM''')
+            return cursor.rowcount
+
+    def get_summary(self):
+        '''return list of (endpoint, count, size in bytes, expired count)'''
+        with self._lock:
+            return self._conn.execute('''SELECT endpoint, COUNT(*), SUM(LENGTH(body)), SUM(CASE WHEN expiry < ? THEN 1 ELSE 0 END)
+                                         FROM http_cache GROUP BY endpoint ORDER BY endpoint''', (time.time(), )).fetchall()
+
+    def print_summary(self):
+        PixivHelper.print_and_log('info', f'Disk cache: {self.path}')
+        for (endpoint, count, size, expired) in self.get_summary():
+            PixivHelper.print_and_log('info', f' - {endpoint}: {count} responses ({expired} expired), {PixivHelper.size_in_str(size or 0)}')
+
+    def print_stats(self):
+        with self._lock:
+            stats = {endpoint: tuple(stat) for (endpoint, stat) in self._stats.items()}
+        if len(stats) == 0:
+            return
+        PixivHelper.print_and_log('info', 'Disk cache statistics:')
+        for (endpoint, (hit, revalidated, miss)) in sorted(stats.items()):
+            PixivHelper.print_and_log('info', f' - {endpoint}: {hit} hits, {revalidated} revalidated, {miss} misses')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_disk_cache_path(config):
+    '''the disk cache is stored next to the database'''
+    if config.dbPath is not None and len(config.dbPath) > 0:
+        directory = os.path.dirname(config.dbPath)
+    else:
+        directory = PixivHelper.module_path()
+    return os.path.join(directory, "cache.sqlite")
+
+
+def get_disk_cache(config):
+    '''return the disk cache if useDiskCache is enabled, else None'''
+    global _disk_cache
+    if config is None or not config.useDiskCache:
+        return None
+    with _cache_lock:
+        if _disk_cache is None:
+            _disk_cache = PixivDiskCache(get_disk_cache_path(config), parse_disk_cache_ttl(config.diskCacheTTL))
+    return _disk_cache
+
+
+def manage_disk_cache(config, purge=False):
+    '''handle --cache-stats and --cache-purge'''
+    path = get_disk_cache_path(config)
+    if not os.path.exists(path):
+        PixivHelper.print_and_log('info', f'Disk cache not found: {path}')
+        return
+    disk_cache = PixivDiskCache(path, parse_disk_cache_ttl(config.diskCacheTTL))
+    try:
+        if purge:
+            count = disk_cache.purge()
+            PixivHelper.print_and_log('info', f'Removed {count} responses from the disk cache.')
+        disk_cache.print_summary()
+    finally:
+        disk_cache.close()
+
+
+def get_cache(config):
+    '''return the shared response cache, the size is limited by responseCacheSize in MB'''
+    global _cache
+    with _cache_lock:
+        if config is None:
+            if _cache is None:
+                _cache = PixivResponseCache(10000, 64 * 1024 * 1024)
+        # rebuild if the size is changed by reloading the config
+        elif _cache is None or _cache._max_bytes != config.responseCacheSize * 1024 * 1024:
+            _cache = PixivResponseCache(10000, config.responseCacheSize * 1024 * 1024)
+    return _cache
+
+
+def print_stats():
+    if _cache is not None:
+        _cache.print_stats()
+    if _disk_cache is not None:
+        _disk_cache.print_stats()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=W0603
+import http.client
+import random
+import threading
+import time
+import urllib.error
+from urllib.parse import urlparse
+
+import PixivHelper
+import PixivRateLimiter
+from PixivException import PixivCircuitOpenException, PixivException
+
+# temporary server errors, other http errors are not retried
+RETRYABLE_CODES = (408, 429, 500, 502, 503, 504)
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def is_retryable(error) -> bool:
+    '''network errors and temporary server errors can be retried, other errors are fatal'''
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in RETRYABLE_CODES
+    if isinstance(error, PixivException):
+        return False
+    # includes URLError, socket.timeout, ssl and requests exceptions
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+def is_server_failure(error) -> bool:
+    '''the host is down or overloaded, throttling (429) is handled by the rate limiter'''
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 408 or error.code >= 500
+    return is_retryable(error)
+
+
+class RetryPolicy(object):
+    '''Exponential backoff with decorrelated jitter, so the retries from several requests do not line up.
+
+       The delay is between base_delay and 3x the previous delay, up to max_delay,
+       or the Retry-After from the server if longer. A request is not retried after max_total seconds.
+    '''
+    base_delay = 5
+    max_delay = 60
+    max_total = 300
+
+    def __init__(self, base_delay, max_delay, max_total):
+        self.base_delay = max(base_delay, 0.1)
+        self.max_delay = max(max_delay, self.base_delay)
+        self.max_total = max_total
+
+    def begin(self, max_retry):
+        '''start retrying a new request'''
+        return RetryState(self, max_retry)
+
+
+class RetryState(object):
+    '''number of retries and backoff of a request'''
+    retry_count = 0
+    max_retry = 0
+    _policy = None
+    _start = 0
+    _last_delay = 0
+
+    def __init__(self, policy, max_retry):
+        self._policy = policy
+        self.max_retry = max_retry
+        self._start = time.monotonic()
+        self._last_delay = policy.base_delay
+
+    def backoff(self) -> float:
+        '''return the next delay in seconds'''
+        delay = min(self._policy.max_delay, random.uniform(self._policy.base_delay, self._last_delay * 3))
+        self._last_delay = delay
+        return delay
+
+    def get_delay(self, error, retry_after=None):
+        '''return the seconds to wait before the next retry, or None if the error is fatal or no more retry is allowed'''
+        if not is_retryable(error):
+            return None
+        if retry_after is None and isinstance(error, urllib.error.HTTPError) and error.headers is not None:
+            retry_after = error.headers.get('Retry-After')
+        return self._next_delay(retry_after)
+
+    def get_status_delay(self, status_code, retry_after=None):
+        '''same as get_delay() for the response status code, e.g. from requests'''
+        if status_code not in RETRYABLE_CODES:
+            return None
+        return self._next_delay(retry_after)
+
+    def _next_delay(self, retry_after):
+        if self.retry_count >= self.max_retry:
+            return None
+        delay = max(self.backoff(), PixivRateLimiter.parse_retry_after(retry_after) or 0)
+        if time.monotonic() - self._start + delay > self._policy.max_total:
+            PixivHelper.get_logger().info("Not retrying, the request would take more than %ss.", self._policy.max_total)
+            return None
+        self.retry_count = self.retry_count + 1
+        return delay
+
+    def wait(self, delay, error=None):
+        message = f'Retrying [{self.retry_count} of {self.max_retry}] in {delay:.1f}s'
+        if error is not None:
+            message = f'{error}, {message}'
+        PixivHelper.print_and_log('warn', message)
+        time.sleep(delay)
+
+
+def get_policy(config):
+    '''return the retry policy using retryWait, retryMaxWait and retryMaxTotalTime'''
+    if config is None:
+        return RetryPolicy(RetryPolicy.base_delay, RetryPolicy.max_delay, RetryPolicy.max_total)
+    return RetryPolicy(config.retryWait, config.retryMaxWait, config.retryMaxTotalTime)
+
+
+class CircuitBreaker(object):
+    '''Stop sending requests to a failing host.
+
+       After threshold consecutive failures the requests to the host fail immediately with PixivCircuitOpenException.
+       After cooldown seconds one request is let through, if it succeeds the requests are sent normally again.
+    '''
+    threshold = 0
+    cooldown = 0
+    _lock = None
+    # host => [consecutive failures, requests are blocked until (time.monotonic())]
+    _hosts = None
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._hosts = dict()
+
+    @staticmethod
+    def get_host(url):
+        if hasattr(url, "get_full_url"):
+            url = url.get_full_url()
+        return urlparse(url).hostname or ""
+
+    def before_request(self, url):
+        '''raise PixivCircuitOpenException if the host is failing'''
+        if self.threshold <= 0:
+            return
+        host = self.get_host(url)
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state[0] < self.threshold:
+                return
+            now = time.monotonic()
+            if now < state[1]:
+                raise PixivCircuitOpenException(host, state[1] - now)
+            # let this request through, block the others until it is completed
+            state[1] = now + self.cooldown
+        PixivHelper.print_and_log('info', f'Checking if {host} is available again.')
+
+    def on_success(self, url):
+        if self.threshold <= 0:
+            return
+        host = self.get_host(url)
+        with self._lock:
+            state = self._hosts.pop(host, None)
+        if state is not None and state[0] >= self.threshold:
+            PixivHelper.print_and_log('info', f'{host} is available again.')
+
+    def on_failure(self, url):
+        if self.threshold <= 0:
+            return
+        host = self.get_host(url)
+        with self._lock:
+            state = self._hosts.setdefault(host, [0, 0])
+            state[0] = state[0] + 1
+            if state[0] < self.threshold:
+                return
+            state[1] = time.monotonic() + self.cooldown
+        PixivHelper.print_and_log('warn', f'{host} failed {state[0]} times in a row, skipping the requests to it for {self.cooldown}s.')
+
+
+def get_breaker(config):
+    '''return the shared circuit breaker using circuitBreakerThreshold and circuitBreakerCooldown'''
+    global _breaker
+    with _breaker_lock:
+        if config is None:
+            if _breaker is None:
+                _breaker = CircuitBreaker(0, 0)
+        # keep the host states across the job configs, only rebuild if the settings are changed
+        elif _breaker is None or \
+                _breaker.threshold != config.circuitBreakerThreshold or \
+                _breaker.cooldown != config.circuitBreakerCooldown:
+            _breaker = CircuitBreaker(config.circuitBreakerThreshold, config.circuitBreakerCooldown)
+    return _breaker
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=W0603
+import threading
+from datetime import datetime
+
+import PixivHelper
+
+ITEM_JOB = "job"
+ITEM_MEMBER = "member"
+ITEM_PAGE = "page"
+ITEM_POST = "post"
+
+_journal = None
+
+
+class PixivRunJournal(object):
+    '''Append-only record of the completed jobs, members, pages and posts of a list or batch run, stored in the database.'''
+    run_id = None
+    _db = None
+    _done = None
+    _scope = ""
+
+    def __init__(self, db, run_id, resume=False):
+        self._db = db
+        self.run_id = run_id
+        self._done = set()
+        self._lock = threading.Lock()
+        if resume:
+            self._done = set(db.selectRunJournal(run_id))
+
+    def set_scope(self, scope=None):
+        '''prefix the keys with the batch job name, so the same member in different jobs is processed again'''
+        self._scope = f"{scope}/" if scope else ""
+
+    def is_done(self, item_type, item_key) -> bool:
+        return (item_type, f"{self._scope}{item_key}") in self._done
+
+    def mark_done(self, item_type, item_key):
+        item_key = f"{self._scope}{item_key}"
+        with self._lock:
+            if (item_type, item_key) not in self._done:
+                self._done.add((item_type, item_key))
+                self._db.insertRunJournal(self.run_id, item_type, item_key)
+
+    def count(self) -> int:
+        return len(self._done)
+
+
+def start(db, mode, run_id=None) -> PixivRunJournal:
+    '''start a new run journal, or continue the given run_id'''
+    global _journal
+    resume = run_id is not None
+    if not resume:
+        run_id = f"{mode}-{datetime.now():%Y%m%d-%H%M%S}"
+    _journal = PixivRunJournal(db, run_id, resume)
+    if resume:
+        if _journal.count() == 0:
+            PixivHelper.print_and_log('warn', f"No journal found for run id: {run_id}, starting from the beginning.")
+        else:
+            PixivHelper.print_and_log('info', f"Resuming run id: {run_id}, skipping {_journal.count()} completed item(s).")
+    PixivHelper.print_and_log('info', f"Run id: {run_id}, use --resume {run_id} to continue if interrupted.")
+    return _journal
+
+
+def stop():
+    global _journal
+    _journal = None
+
+
+def get_journal():
+    '''return the journal of the running list or batch job, or None'''
+    return _journal
@@ -9,6 +9,7 @@ import PixivBrowserFactory
 import PixivConstant
 import PixivHelper
 import PixivImageHandler
+import PixivRunJournal
 from PixivTags import PixivTags
 
 
@@ -105,8 +106,16 @@ def process_tags(caller,
                 # Issue #1090 reset retry flag on succesfull load
                 empty_page_retry = 0
 
-                for item in t.itemList:
+                journal = PixivRunJournal.get_journal()
+                page_image_ids = [x.imageId for x in t.itemList]
+                downloaded = PixivImageHandler.get_downloaded_image_ids(caller, config, page_image_ids)
+                for (index, item) in enumerate(t.itemList):
                     last_image_id = item.imageId
+                    if journal is not None and journal.is_done(PixivRunJournal.ITEM_POST, item.imageId):
+                        PixivHelper.print_and_log(None, f'Image Id: {item.imageId} already completed in run id: {journal.run_id}')
+                        images = images + 1
+                        continue
+                    PixivImageHandler.prefetch_image_pages(caller, config, page_image_ids[index + 1:], downloaded)
                     PixivHelper.print_and_log(None, f'Image #{images}')
                     PixivHelper.print_and_log(None, f'Image Id: {item.imageId}')
 
@@ -141,7 +150,10 @@ def process_tags(caller,
                                                                                                              skipped_count,
                                                                                                              total_image)
                             result = PixivConstant.PIXIVUTIL_OK
-                            if not caller.DEBUG_SKIP_PROCESS_IMAGE:
+                            if int(item.imageId) in downloaded:
+                                PixivHelper.print_and_log(None, f'Already downloaded in DB: {item.imageId}')
+                                result = PixivConstant.PIXIVUTIL_SKIP_DUPLICATE_NO_WAIT
+                            elif not caller.DEBUG_SKIP_PROCESS_IMAGE:
                                 result = PixivImageHandler.process_image(caller,
                                                                          config,
                                                                          None,
@@ -162,6 +174,8 @@ def process_tags(caller,
                             PixivHelper.print_delay(2)
 
                     images = images + 1
+                    if journal is not None and result not in (PixivConstant.PIXIVUTIL_NOT_OK, PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT):
+                        journal.mark_done(PixivRunJournal.ITEM_POST, item.imageId)
                     if result in (PixivConstant.PIXIVUTIL_SKIP_DUPLICATE,
                                   PixivConstant.PIXIVUTIL_SKIP_LOCAL_LARGER,
                                   PixivConstant.PIXIVUTIL_SKIP_DUPLICATE_NO_WAIT):
@@ -173,8 +187,7 @@ def process_tags(caller,
                         gc.collect()
                         continue
                     elif result == PixivConstant.PIXIVUTIL_KEYBOARD_INTERRUPT:
-                        choice = input("Keyboard Interrupt detected, continue to next image (Y/N)").rstrip("\r")
-                        if choice.upper() == 'N':
+                        if not PixivHelper.ask_continue("Keyboard Interrupt detected, continue to next image (Y/N)"):
                             PixivHelper.print_and_log("info", f"Tags: {tags}, processing aborted.")
                             flag = False
                             break
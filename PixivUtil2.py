@@ -21,14 +21,18 @@ import PixivBatchHandler
 import PixivBookmarkHandler
 import PixivBrowserFactory
 import PixivConfig
+import PixivConnectionPool
 import PixivConstant
+import PixivDownloadEngine
 import PixivFanboxHandler
 import PixivHelper
 import PixivImageHandler
 import PixivListHandler
 import PixivModelFanbox
 import PixivNovelHandler
+import PixivPostProcessor
 import PixivRankingHandler
+import PixivResponseCache
 import PixivSketchHandler
 import PixivTagsHandler
 from PixivDBManager import PixivDBManager
@@ -500,7 +504,9 @@ def menu_download_from_list(opisvalid, args, options):
                                   __config__,
                                   list_file_name=list_file_name,
                                   tags=tags,
-                                  include_sketch=include_sketch)
+                                  include_sketch=include_sketch,
+                                  run_id=options.resume_run_id if opisvalid else None,
+                                  parallel_members=options.parallel_members if opisvalid else 1)
 
 
 def menu_download_from_online_user_bookmark(opisvalid, args, options):
@@ -1231,6 +1237,8 @@ def menu_download_new_illusts(op_is_valid, args, options):
 def menu_reload_config():
     __log__.info('Manual Reload Config (r).')
     __config__.loadConfig(path=configfile)
+    # config is reloaded in place, so re-apply it explicitly
+    PixivBrowserFactory.getBrowser()._configureBrowser(__config__)
 
 
 def menu_print_config():
@@ -1300,6 +1308,27 @@ d  - Manage database''')
                       dest='batch_file',
                       default=None,
                       help='Json file for batch job (b).')
+    parser.add_option('--resume',
+                      dest='resume_run_id',
+                      default=None,
+                      help='''Resume the interrupted run id, skipping the completed members and posts. \n
+Used in option 4 and b.''')
+    parser.add_option('--parallel-members',
+                      dest='parallel_members',
+                      default=1,
+                      type='int',
+                      help='''Number of members to process at the same time, requires useRateLimiter = True. \n
+Used in option 4.''')
+    parser.add_option('--cache-stats',
+                      dest='cache_stats',
+                      default=False,
+                      help='Show the content of the disk cache and exit.',
+                      action='store_true')
+    parser.add_option('--cache-purge',
+                      dest='cache_purge',
+                      default=False,
+                      help='Remove all responses from the disk cache and exit.',
+                      action='store_true')
     parser.add_option('--sp', '--start_page',
                       dest='start_page',
                       default=None,
@@ -1474,7 +1503,7 @@ def main_loop(ewd, op_is_valid, selection, np_is_valid_local, args, options):
             elif selection == "l":
                 menu_export_database_images(op_is_valid, args, options)
             elif selection == 'b':
-                PixivBatchHandler.process_batch_job(sys.modules[__name__], batch_file=options.batch_file)
+                PixivBatchHandler.process_batch_job(sys.modules[__name__], batch_file=options.batch_file, run_id=options.resume_run_id)
             elif selection == 'e':
                 menu_export_online_bookmark(op_is_valid, args, options)
             elif selection == 'm':
@@ -1698,6 +1727,10 @@ def main():
         __dbManager__ = PixivDBManager(root_directory=__config__.rootDirectory, target=__config__.dbPath)
         __dbManager__.createDatabase()
 
+        if options.cache_stats or options.cache_purge:
+            PixivResponseCache.manage_disk_cache(__config__, purge=options.cache_purge)
+            return
+
         if __config__.useList:
             PixivListHandler.import_list(sys.modules[__name__], __config__, 'list.txt')
 
@@ -1787,6 +1820,12 @@ def main():
         PixivHelper.print_and_log("error", f"Unknown Error, please check the log file: {sys.exc_info()}")
         ERROR_CODE = getattr(ex, 'errorCode', -1)
     finally:
+        PixivDownloadEngine.shutdown()
+        PixivBrowserFactory.shutdown_prefetch()
+        PixivPostProcessor.shutdown()
+        PixivConnectionPool.print_stats()
+        PixivBrowserFactory.print_transfer_stats()
+        PixivResponseCache.print_stats()
         __dbManager__.close()
         if not ewd:  # Yavos: prevent input on exit_when_done
             if selection is None or selection != 'x':
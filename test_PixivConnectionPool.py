@@ -0,0 +1,52 @@
+#!C:/Python37-32/python
+# -*- coding: UTF-8 -*-
+
+import gzip
+import http.server
+import threading
+import unittest
+
+import PixivConfig
+import PixivConnectionPool
+
+BODY = b"0123456789" * 10000
+
+
+class _GzipHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        # compress the body if the client allows it
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(BODY)
+            self.send_response(200)
+            self.send_header("Content-Encoding", "gzip")
+        else:
+            body = BODY
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPixivConnectionPool(unittest.TestCase):
+    def testUncompressedBody(self):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _GzipHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            pool = PixivConnectionPool.PixivConnectionPool(PixivConfig.PixivConfig(), None)
+            res = pool.open(f"http://127.0.0.1:{server.server_address[1]}/file.txt", {"Accept-Encoding": "gzip"})
+            self.assertEqual(int(res.info()["Content-Length"]), len(BODY))
+            data = res.read()
+            res.close()
+            self.assertEqual(data, BODY)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    # unittest.main()
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPixivConnectionPool)
+    unittest.TextTestRunner(verbosity=5).run(suite)
@@ -37,6 +37,40 @@ class TestPixivDBManager(object):
         for item in result:
             print(item.memberId, item.path)
 
+    def test_RunJournal(self):
+        DB = PixivDBManager(root_directory=".", target="test.db.sqlite")
+        DB.createDatabase()
+        DB.insertRunJournal("test-run", "member", 1234)
+        DB.insertRunJournal("test-run", "member", 1234)
+        DB.insertRunJournal("test-run", "post", 5678)
+        result = DB.selectRunJournal("test-run")
+        assert sorted(result) == [("member", "1234"), ("post", "5678")]
+
+    def test_LastSyncImage(self):
+        DB = PixivDBManager(root_directory=".", target="test.db.sqlite")
+        DB.createDatabase()
+        DB.insertNewMember(98765432)
+        assert DB.selectLastSyncImageByMemberId(98765432) == 0
+        # last_image is not used as the sync marker
+        DB.updateLastDownloadedImage(98765432, 900001)
+        assert DB.selectLastSyncImageByMemberId(98765432) == 0
+        DB.updateLastSyncImage(98765432, 901500)
+        assert DB.selectLastSyncImageByMemberId(98765432) == 901500
+        DB.deleteMemberByMemberId(98765432)
+        assert DB.selectLastSyncImageByMemberId(98765432) == 0
+
+    def test_SelectDownloadedImageIds(self):
+        DB = PixivDBManager(root_directory=".", target="test.db.sqlite")
+        DB.createDatabase()
+        DB.insertImage(1234, 900001)
+        DB.updateImage(900001, "downloaded", "900001.jpg")
+        DB.insertImage(1234, 900002)
+        DB.insertImage(1234, 901500)
+        DB.updateImage(901500, "downloaded", "901500.jpg")
+        # more than the sqlite variable limit, 900002 is not downloaded (save_name = N/A)
+        result = DB.selectDownloadedImageIds([str(x) for x in range(900000, 902000)])
+        assert result == {900001, 901500}
+
 
 # if __name__ == '__main__':
 #     suite = unittest.TestLoader().loadTestsFromTestCase(TestPixivDBManager)
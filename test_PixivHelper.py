@@ -1,9 +1,12 @@
 #!C:/Python37-32/python
 # -*- coding: UTF-8 -*-
 
+import hashlib
+import io
 import json
 import os
 import platform
+import threading
 import unittest
 
 from bs4 import BeautifulSoup
@@ -13,6 +16,7 @@ import PixivConfig
 import PixivConstant
 import PixivHelper
 from PixivArtist import PixivArtist
+from PixivException import PixivException
 from PixivImage import PixivImage
 
 PixivConstant.PIXIVUTIL_LOG_FILE = 'pixivutil.test.log'
@@ -324,6 +328,71 @@ class TestPixivHelper(unittest.TestCase):
         # print(r)
         self.assertTrue(len(r) > 0)
 
+    def testDownloadImageResumeWithHash(self):
+        _config = PixivConfig.PixivConfig()
+        _config.downloadBuffer = 1
+        PixivHelper.set_config(_config)
+        data = bytes(range(256)) * 20
+        filename = os.path.abspath('./test/test-download-resume.bin')
+
+        # incomplete download with known validator, keep the .pixiv file
+        PixivHelper.set_resume_validator(filename, '"test-etag"')
+        with self.assertRaises(PixivException):
+            PixivHelper.download_image('https://example.com/test.bin', filename, io.BytesIO(data[:3000]), len(data), False, 0, ["md5"])
+        self.assertEqual(PixivHelper.get_resume_validator(filename), (3000, '"test-etag"'))
+
+        # resume and hash the whole file
+        (size, result_filename, hashes) = PixivHelper.download_image('https://example.com/test.bin', filename, io.BytesIO(data[3000:]),
+                                                                     len(data), False, 3000, ["md5", "sha256"])
+        self.assertEqual(size, len(data))
+        self.assertEqual(hashes["md5"], hashlib.md5(data).hexdigest())
+        self.assertEqual(hashes["sha256"], hashlib.sha256(data).hexdigest())
+        self.assertEqual(PixivHelper.get_hash(result_filename, "sha256"), hashes["sha256"])
+        self.assertFalse(os.path.exists(filename + '.pixiv.resume'))
+        os.remove(result_filename)
+
+    def testGetReadSize(self):
+        buffer_size = 512 * 1024
+        # small file is read at once
+        self.assertEqual(PixivHelper.get_read_size(buffer_size, buffer_size, 1000), 1000)
+        # fast read, increase up to 16x
+        self.assertEqual(PixivHelper.get_read_size(buffer_size, buffer_size, -1, buffer_size, 0.01), buffer_size * 2)
+        self.assertEqual(PixivHelper.get_read_size(buffer_size, buffer_size * 16, -1, buffer_size * 16, 0.01), buffer_size * 16)
+        # slow read, decrease down to 1/8
+        self.assertEqual(PixivHelper.get_read_size(buffer_size, buffer_size, -1, buffer_size, 1.0), buffer_size // 2)
+        self.assertEqual(PixivHelper.get_read_size(buffer_size, buffer_size // 8, -1, 1000, 1.0), buffer_size // 8)
+
+    def testWorkerOutput(self):
+        stream = io.StringIO()
+        output = PixivHelper.WorkerOutput(stream)
+        output.write("no prefix ")
+        output.set_prefix("[123] ")
+        output.write("Start downloading ")
+        self.assertEqual(stream.getvalue(), "no prefix ")
+        output.write("\r[━━  ] 50%")
+        output.write("\r[━━━━] 100%\n\n")
+        output.write("pending")
+        output.set_prefix(None)
+        self.assertEqual(stream.getvalue(), "no prefix [123] Start downloading [━━━━] 100%\n\n[123] pending\n")
+
+    def testWorkerOutputKeepsMessages(self):
+        stream = io.StringIO()
+        output = PixivHelper.WorkerOutput(stream)
+        output.set_prefix("[123] ")
+        output.write("\rResuming download from 1.0 MB...")
+        output.write("\r\x1b[31m[━━  ]\x1b[0m 50%    ")
+        output.write("\r\x1b[32m[━━━━]\x1b[0m 100%   ")
+        output.write("\rCompleted\n")
+        self.assertEqual(stream.getvalue(), "[123] Resuming download from 1.0 MB... \x1b[32m[━━━━]\x1b[0m 100% Completed\n")
+
+    def testAskContinueInWorker(self):
+        # the worker thread must not wait for the console
+        result = list()
+        worker = threading.Thread(target=lambda: result.append(PixivHelper.ask_continue("continue (Y/N)")))
+        worker.start()
+        worker.join(5)
+        self.assertEqual(result, [False])
+
 
 if __name__ == '__main__':
     # unittest.main()
@@ -0,0 +1,134 @@
+#!C:/Python37-32/python
+# -*- coding: UTF-8 -*-
+
+import threading
+import time
+import unittest
+
+import PixivConfig
+import PixivRateLimiter
+from PixivOAuth import PixivOAuth
+
+
+class TestPixivRateLimiter(unittest.TestCase):
+    def testGetHostClass(self):
+        self.assertEqual(PixivRateLimiter.get_host_class("https://www.pixiv.net/ajax/illust/123"), "pixiv")
+        self.assertEqual(PixivRateLimiter.get_host_class("https://i.pximg.net/img-original/img/123_p0.png"), "image")
+        self.assertEqual(PixivRateLimiter.get_host_class("https://app-api.pixiv.net/v1/user/detail"), "api")
+        self.assertEqual(PixivRateLimiter.get_host_class("https://api.fanbox.cc/post.info"), "fanbox")
+        self.assertEqual(PixivRateLimiter.get_host_class("https://downloads.fanbox.cc/files/post/1/a.zip"), "fanbox_download")
+        self.assertEqual(PixivRateLimiter.get_host_class("https://sketch.pixiv.net/api/walls"), "sketch")
+        self.assertEqual(PixivRateLimiter.get_host_class("https://raw.githubusercontent.com/"), "other")
+
+    def testParseRateLimits(self):
+        result = PixivRateLimiter.parse_rate_limits("pixiv=1, image=10,api=0.5,")
+        self.assertEqual(result, {"pixiv": 1.0, "image": 10.0, "api": 0.5})
+
+    def testParseRetryAfter(self):
+        self.assertEqual(PixivRateLimiter.parse_retry_after("120"), 120.0)
+        self.assertEqual(PixivRateLimiter.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        self.assertIsNone(PixivRateLimiter.parse_retry_after("soon"))
+        self.assertIsNone(PixivRateLimiter.parse_retry_after(None))
+
+    def testTokenBucketAimd(self):
+        bucket = PixivRateLimiter.TokenBucket(8, burst=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertTrue(bucket.reserve() > 0)
+
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 4)
+        bucket.on_throttle(retry_after=30)
+        self.assertEqual(bucket.rate, 2)
+        self.assertTrue(bucket.reserve() > 29)
+
+        bucket.on_success()
+        self.assertAlmostEqual(bucket.rate, 2.8)
+        for _ in range(20):
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 8)
+
+    def testLimiterFromConfig(self):
+        config = PixivConfig.PixivConfig()
+        # enabled by default
+        self.assertTrue(config.useRateLimiter)
+        config.useRateLimiter = False
+        self.assertIsNone(PixivRateLimiter.get_limiter(config))
+        config.useRateLimiter = True
+        config.rateLimits = "image=5,other=2"
+        limiter = PixivRateLimiter.get_limiter(config)
+        self.assertEqual(limiter.get_bucket("https://i.pximg.net/a.png").max_rate, 5)
+        self.assertEqual(limiter.get_bucket("https://www.pixiv.net/").max_rate, 2)
+        self.assertIs(PixivRateLimiter.get_limiter(config), limiter)
+        # rebuilt when the limits are changed
+        config.rateLimits = "image=4,other=2"
+        self.assertEqual(PixivRateLimiter.get_limiter(config).get_bucket("https://i.pximg.net/a.png").max_rate, 4)
+
+    def testWorkersShareBucket(self):
+        # same as the --parallel-members workers, the limiter is shared by the threads
+        config = PixivConfig.PixivConfig()
+        config.rateLimits = "pixiv=10,other=1"
+        limiters = list()
+
+        def worker():
+            limiter = PixivRateLimiter.get_limiter(config)
+            limiters.append(limiter)
+            for _ in range(5):
+                limiter.acquire("https://www.pixiv.net/ajax/illust/123")
+        workers = [threading.Thread(target=worker) for _ in range(4)]
+        start = time.monotonic()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(len(set(limiters)), 1)
+        # 20 requests: 10 from the burst, the other 10 at 10/s for all workers
+        self.assertTrue(time.monotonic() - start >= 0.9)
+
+    def testOAuthRequestsAreLimited(self):
+        config = PixivConfig.PixivConfig()
+        config.useRateLimiter = True
+        config.rateLimits = "api=2,other=1"
+        config.retry = 0
+        oauth = PixivOAuth("username", "password", config=config)
+
+        class Response(object):
+            status_code = 429
+            headers = {}
+        urls = list()
+
+        def send(url, **kwargs):
+            urls.append(url)
+            return Response()
+        response = oauth._send(send, "https://app-api.pixiv.net/v1/user/detail?user_id=1", dict)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(urls), 1)
+        # the throttled api requests are slowed down
+        bucket = PixivRateLimiter.get_limiter(config).get_bucket("https://app-api.pixiv.net/")
+        self.assertEqual(bucket.rate, 1)
+
+    def testHostConcurrency(self):
+        config = PixivConfig.PixivConfig()
+        config.concurrencyLimits = "image=2,other=1"
+        concurrency = PixivRateLimiter.get_concurrency(config)
+        self.assertEqual(concurrency.get_limit("https://i.pximg.net/a.png"), 2)
+        self.assertEqual(concurrency.get_limit("https://www.pixiv.net/"), 1)
+        # rebuilt when the limits are changed
+        config.concurrencyLimits = "image=3,other=1"
+        self.assertEqual(PixivRateLimiter.get_concurrency(config).get_limit("https://i.pximg.net/a.png"), 3)
+        config.concurrencyLimits = "image=2,other=1"
+        concurrency = PixivRateLimiter.get_concurrency(config)
+        with concurrency.slot("https://www.pixiv.net/"):
+            # the other host classes are not blocked
+            with concurrency.slot("https://i.pximg.net/a.png"):
+                self.assertFalse(concurrency._semaphores["pixiv"].acquire(blocking=False))
+                self.assertTrue(concurrency._semaphores["image"].acquire(blocking=False))
+                concurrency._semaphores["image"].release()
+        self.assertTrue(concurrency._semaphores["pixiv"].acquire(blocking=False))
+        concurrency._semaphores["pixiv"].release()
+
+
+if __name__ == '__main__':
+    # unittest.main()
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPixivRateLimiter)
+    unittest.TextTestRunner(verbosity=5).run(suite)
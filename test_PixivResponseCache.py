@@ -0,0 +1,88 @@
+#!C:/Python37-32/python
+# -*- coding: UTF-8 -*-
+
+import unittest
+
+import PixivConfig
+import PixivResponseCache
+
+
+class TestPixivResponseCache(unittest.TestCase):
+    def testGetEndpoint(self):
+        self.assertEqual(PixivResponseCache.get_endpoint("https://www.pixiv.net/ajax/illust/123?lang=en"), "www.pixiv.net/ajax/illust/{id}")
+        self.assertEqual(PixivResponseCache.get_endpoint("https://app-api.pixiv.net/v1/user/detail?user_id=1"), "app-api.pixiv.net/v{id}/user/detail")
+
+    def testEvictLeastRecentlyUsed(self):
+        cache = PixivResponseCache.PixivResponseCache(2, 1024)
+        cache.put("https://www.pixiv.net/ajax/illust/1", "a")
+        cache.put("https://www.pixiv.net/ajax/illust/2", "b")
+        self.assertEqual(cache.get("https://www.pixiv.net/ajax/illust/1"), "a")
+        cache.put("https://www.pixiv.net/ajax/illust/3", "c")
+        self.assertIsNone(cache.get("https://www.pixiv.net/ajax/illust/2"))
+        self.assertEqual(cache.get("https://www.pixiv.net/ajax/illust/1"), "a")
+        self.assertEqual(cache.get_stats()["www.pixiv.net/ajax/illust/{id}"], (2, 1, 1))
+
+    def testSizeLimit(self):
+        cache = PixivResponseCache.PixivResponseCache(100, 10)
+        cache.put("https://www.pixiv.net/a", "12345")
+        cache.put("https://www.pixiv.net/b", "12345")
+        cache.put("https://www.pixiv.net/c", "12345")
+        self.assertIsNone(cache.get("https://www.pixiv.net/a"))
+        self.assertEqual(cache.get("https://www.pixiv.net/c"), "12345")
+        # larger than the limit, not cached
+        cache.put("https://www.pixiv.net/d", "12345678901")
+        self.assertIsNone(cache.get("https://www.pixiv.net/d"))
+
+    def testSizeOfParsedResponse(self):
+        cache = PixivResponseCache.PixivResponseCache(100, 10)
+        # the size of the response is used, the parsed json is not measured again
+        cache.put("https://www.pixiv.net/a", {"body": 1}, size=11)
+        self.assertIsNone(cache.get("https://www.pixiv.net/a"))
+        cache.put("https://www.pixiv.net/b", {"body": 1}, size=10)
+        self.assertEqual(cache.get("https://www.pixiv.net/b"), {"body": 1})
+
+    def testCacheFromConfig(self):
+        config = PixivConfig.PixivConfig()
+        config.responseCacheSize = 1
+        cache = PixivResponseCache.get_cache(config)
+        self.assertIs(PixivResponseCache.get_cache(config), cache)
+        # rebuilt when the size is changed
+        config.responseCacheSize = 2
+        self.assertIsNot(PixivResponseCache.get_cache(config), cache)
+
+    def testExpired(self):
+        cache = PixivResponseCache.PixivResponseCache(100, 1024)
+        cache.put("https://www.pixiv.net/a", {"body": 1}, expiration=-1)
+        self.assertIsNone(cache.get("https://www.pixiv.net/a"))
+
+    def testDiskCache(self):
+        disk_cache = PixivResponseCache.PixivDiskCache(":memory:", PixivResponseCache.parse_disk_cache_ttl("user=3600,illust=0"))
+        # not cached endpoint
+        disk_cache.put("https://www.pixiv.net/ajax/user/1/illusts/bookmarks?tag=", b"{}")
+        self.assertIsNone(disk_cache.get("https://www.pixiv.net/ajax/user/1/illusts/bookmarks?tag="))
+
+        disk_cache.put("https://www.pixiv.net/ajax/user/1", b"user", etag='"a"')
+        entry = disk_cache.get("https://www.pixiv.net/ajax/user/1")
+        self.assertTrue(entry.fresh)
+        self.assertEqual(entry.body, b"user")
+        # not expired, but the caller wants the latest response
+        entry = disk_cache.get("https://www.pixiv.net/ajax/user/1", revalidate=True)
+        self.assertFalse(entry.fresh)
+        self.assertEqual(entry.etag, '"a"')
+
+        # expired, revalidate with etag
+        disk_cache.put("https://www.pixiv.net/ajax/illust/2?lang=en", b"illust", etag='"b"')
+        entry = disk_cache.get("https://www.pixiv.net/ajax/illust/2?lang=en")
+        self.assertFalse(entry.fresh)
+        self.assertEqual(entry.etag, '"b"')
+
+        # expired without validator
+        disk_cache.put("https://www.pixiv.net/ajax/illust/3", b"illust")
+        self.assertIsNone(disk_cache.get("https://www.pixiv.net/ajax/illust/3"))
+        self.assertEqual(disk_cache.purge(), 3)
+
+
+if __name__ == '__main__':
+    # unittest.main()
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPixivResponseCache)
+    unittest.TextTestRunner(verbosity=5).run(suite)
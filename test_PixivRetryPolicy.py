@@ -0,0 +1,86 @@
+#!C:/Python37-32/python
+# -*- coding: UTF-8 -*-
+
+import socket
+import unittest
+from urllib.error import HTTPError, URLError
+
+import PixivConfig
+import PixivRetryPolicy
+from PixivException import PixivCircuitOpenException, PixivException
+
+
+class TestPixivRetryPolicy(unittest.TestCase):
+    def testIsRetryable(self):
+        self.assertTrue(PixivRetryPolicy.is_retryable(HTTPError("https://www.pixiv.net/", 503, "Service Unavailable", {}, None)))
+        self.assertTrue(PixivRetryPolicy.is_retryable(HTTPError("https://www.pixiv.net/", 429, "Too Many Requests", {}, None)))
+        self.assertFalse(PixivRetryPolicy.is_retryable(HTTPError("https://www.pixiv.net/", 404, "Not Found", {}, None)))
+        self.assertTrue(PixivRetryPolicy.is_retryable(URLError("connection refused")))
+        self.assertTrue(PixivRetryPolicy.is_retryable(socket.timeout()))
+        self.assertFalse(PixivRetryPolicy.is_retryable(PixivException("failed", errorCode=PixivException.SERVER_ERROR)))
+        self.assertFalse(PixivRetryPolicy.is_retryable(ValueError()))
+
+    def testBackoff(self):
+        retry_state = PixivRetryPolicy.RetryPolicy(1, 10, 300).begin(10)
+        previous = 1
+        for _ in range(20):
+            delay = retry_state.backoff()
+            self.assertTrue(1 <= delay <= min(10, previous * 3))
+            previous = delay
+
+    def testGetDelay(self):
+        retry_state = PixivRetryPolicy.RetryPolicy(1, 10, 300).begin(2)
+        error = HTTPError("https://www.pixiv.net/", 429, "Too Many Requests", {"Retry-After": "30"}, None)
+        self.assertEqual(retry_state.get_delay(error), 30)
+        self.assertTrue(retry_state.get_status_delay(503) <= 10)
+        # no more retry
+        self.assertIsNone(retry_state.get_delay(error))
+        self.assertIsNone(PixivRetryPolicy.RetryPolicy(1, 10, 300).begin(2).get_status_delay(403))
+
+    def testMaxTotal(self):
+        retry_state = PixivRetryPolicy.RetryPolicy(1, 10, 20).begin(5)
+        error = HTTPError("https://www.pixiv.net/", 503, "Service Unavailable", {"Retry-After": "30"}, None)
+        self.assertIsNone(retry_state.get_delay(error))
+
+    def testCircuitBreaker(self):
+        breaker = PixivRetryPolicy.CircuitBreaker(2, 60)
+        url = "https://i.pximg.net/img-original/img/1_p0.jpg"
+        breaker.before_request(url)
+        breaker.on_failure(url)
+        breaker.before_request(url)
+        breaker.on_failure(url)
+        self.assertRaises(PixivCircuitOpenException, breaker.before_request, url)
+        # other hosts are not affected
+        breaker.before_request("https://www.pixiv.net/")
+
+        # cool down is over, only one request is let through
+        breaker._hosts["i.pximg.net"][1] = 0
+        breaker.before_request(url)
+        self.assertRaises(PixivCircuitOpenException, breaker.before_request, url)
+        breaker.on_success(url)
+        breaker.before_request(url)
+
+    def testBreakerFromConfig(self):
+        config = PixivConfig.PixivConfig()
+        config.circuitBreakerThreshold = 3
+        config.circuitBreakerCooldown = 60
+        breaker = PixivRetryPolicy.get_breaker(config)
+        self.assertEqual(breaker.threshold, 3)
+        self.assertIs(PixivRetryPolicy.get_breaker(config), breaker)
+        # rebuilt when the settings are changed
+        config.circuitBreakerCooldown = 30
+        breaker = PixivRetryPolicy.get_breaker(config)
+        self.assertEqual(breaker.cooldown, 30)
+        self.assertEqual(breaker.threshold, 3)
+
+    def testIsServerFailure(self):
+        self.assertTrue(PixivRetryPolicy.is_server_failure(HTTPError("https://www.pixiv.net/", 502, "Bad Gateway", {}, None)))
+        self.assertFalse(PixivRetryPolicy.is_server_failure(HTTPError("https://www.pixiv.net/", 429, "Too Many Requests", {}, None)))
+        self.assertFalse(PixivRetryPolicy.is_server_failure(HTTPError("https://www.pixiv.net/", 404, "Not Found", {}, None)))
+        self.assertTrue(PixivRetryPolicy.is_server_failure(socket.timeout()))
+
+
+if __name__ == '__main__':
+    # unittest.main()
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPixivRetryPolicy)
+    unittest.TextTestRunner(verbosity=5).run(suite)